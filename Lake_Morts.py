@@ -1,15 +1,515 @@
+import argparse
+import atexit
+import itertools
+import json
 import math
+import multiprocessing
+import os
+import random
+import struct
 import sys
+import threading
+import zlib
 from collections import namedtuple
+from functools import cached_property
 from time import time
 
-#Code from Textbook with some minor modifications
-GameState = namedtuple('GameState', 'to_move, utility, board, moves, removed, stalemate_count')
+from book import OpeningBook
+from ordering import MAX_PLY, MoveOrderer
+from profiling import MoveProfiler
+from symmetry import canonical_pieces, inverse, symmetries, transform_mask
+from tablebase import Tablebases
+from timeman import SearchTimeout, TimeManager
+from transposition import EXACT, LOWER, UPPER, EvalCache, SharedTranspositionTable, TranspositionTable
+
 time_limit = 5  # seconds
+safe_margin = 0.25  # Send the move this many seconds before the time limit
+tt_size_mb = 32  # memory budget of the transposition table
+eval_cache_mb = 8  # memory budget of the static evaluation cache
 stalemate_threshold = 20
+quiescence_depth = 0  # plies of captures and mill blocks searched past the horizon, 0 turns quiescence off
+# Selective search, each part can be switched off on its own to measure what it does
+use_lmr = True  # late move reductions
+use_futility = True  # futility pruning of quiet moves near the leaves
+use_razoring = True  # drop straight to the leaf evaluation when a node near the leaves is hopeless
+use_symmetry = True  # share transposition table entries between positions that are symmetries of each other
+opening_book = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin')  # built by book_builder.py
+tablebase_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')  # built by tablebase_builder.py
 # Assumptions made:
 # When a mill is created, opponent's piece *must* be removed
 
+# Board positions, the index of a position in this list is its bit in a bitboard
+POSITIONS = ["a1", "a4", "a7", "b2", "b4", "b6",
+             "c3", "c4", "c5", "d1", "d2", "d3",
+             "d5", "d6", "d7", "e3", "e4", "e5",
+             "f2", "f4", "f6", "g1", "g4", "g7"]
+SQUARE_INDEX = {pos: i for i, pos in enumerate(POSITIONS)}
+FULL_BOARD = (1 << len(POSITIONS)) - 1
+STONES_PER_PLAYER = 10
+
+PLAYERS = ('blue', 'orange')
+PLAYER_INDEX = {'blue': 0, 'orange': 1}
+
+ADJACENT = {
+    'a1': ['a4', 'd1'],
+    'a4': ['a1', 'a7', 'b4'],
+    'a7': ['a4', 'd7'],
+    'b2': ['b4', 'd2'],
+    'b4': ['a4', 'b2', 'b6', 'c4'],
+    'b6': ['b4', 'd6'],
+    'c3': ['c4', 'd3'],
+    'c4': ['b4', 'c3', 'c5'],
+    'c5': ['c4', 'd5'],
+    'd1': ['a1', 'd2', 'g1'],
+    'd2': ['b2', 'd1', 'd3', 'f2'],
+    'd3': ['c3', 'd2', 'e3'],
+    'd5': ['c5', 'd6', 'e5'],
+    'd6': ['b6', 'd5', 'd7', 'f6'],
+    'd7': ['a7', 'd6', 'g7'],
+    'e3': ['d3', 'e4'],
+    'e4': ['e3', 'e5', 'f4'],
+    'e5': ['d5', 'e4'],
+    'f2': ['d2', 'f4'],
+    'f4': ['e4', 'f2', 'f6', 'g4'],
+    'f6': ['d6', 'f4'],
+    'g1': ['d1', 'g4'],
+    'g4': ['f4', 'g1', 'g7'],
+    'g7': ['d7', 'g4']
+}
+
+# Optimal board position weights during the placement phase, weights are pretty arbitrary and are just my best guess
+POSITION_WEIGHTS = {
+    # Row 1
+    "a1": 0.8,
+    "d1": 1.0,
+    "g1": 0.8,
+
+    # Row 2
+    "b2": 1.0,
+    "d2": 1.4, # Next to d3 intersection
+    "f2": 1.0,
+
+    # Row 3
+    "c3": 1.2, # Corner of inner square
+    "d3": 2.5, # Intersection
+    "e3": 1.2, # Corner of inner square
+
+    # Row 4
+    "a4": 1.0,
+    "b4": 1.4, # Next to c4 intersection
+    "c4": 2.5, # Intersection
+    "e4": 2.5, # Intersection
+    "f4": 1.4, # Next to e4 intersection
+    "g4": 1.0,
+
+    # Row 5
+    "c5": 1.2, # Corner of inner square
+    "d5": 2.5, # Intersection
+    "e5": 1.2, # Corner of inner square
+
+    # Row 6
+    "b6": 1.0,
+    "d6": 1.4, # Next to d5 intersection
+    "f6": 1.0,
+
+    # Row 7
+    "a7": 0.8,
+    "d7": 1.0,
+    "g7": 0.8
+}
+
+# Weights for utility() in each game phase as (mills, potential mills, pieces, legal moves),
+# weights are pretty arbitrary and are just my best guess
+PHASE_WEIGHTS = {
+    'placement': (20, 14, 5, 0.5),
+    'moving': (15, 6, 2, 1),
+    'flying': (10, 4, 2.5, 1.5),
+}
+# Multiplier of the positional bonus, which only counts during the placement phase
+POSITIONAL_WEIGHT = 4
+
+# The search scores positions in integer tenths of a utility() point, so evaluation terms can be
+# updated incrementally without float drift
+EVAL_SCALE = 10
+WIN_SCORE = 1000 * EVAL_SCALE
+# Half width of the first aspiration window around the last iteration's score, and the width past which
+# a failing window just opens up completely
+ASPIRATION_WINDOW = 20 * EVAL_SCALE
+MAX_ASPIRATION = 160 * EVAL_SCALE
+# The positional weight is folded into the square values, so whatever it is the evaluation stays in integers
+POSITION_VALUES = [round(POSITIONAL_WEIGHT * POSITION_WEIGHTS[pos] * EVAL_SCALE) for pos in POSITIONS]
+SCALED_PHASE_WEIGHTS = {phase: tuple(round(w * EVAL_SCALE) for w in weights)
+                        for phase, weights in PHASE_WEIGHTS.items()}
+
+def get_weights():
+    """The evaluation weights as a dict that set_weights takes (and that json can write)"""
+    return {'phase': {phase: list(weights) for phase, weights in PHASE_WEIGHTS.items()},
+            'positional': POSITIONAL_WEIGHT,
+            'position': dict(POSITION_WEIGHTS)}
+
+def set_weights(weights):
+    """
+    Replace the evaluation weights with the ones in a dict like get_weights() returns, anything left out keeps
+    its current value. The tables are changed in place, so the evaluation picks them up straight away.
+    Evaluations already in Lasker_Morris.eval_cache were made with the old weights, it's up to the caller to clear it
+    """
+    global POSITIONAL_WEIGHT, PLACEMENT_SYMMETRIES
+    PHASE_WEIGHTS.update({phase: tuple(w) for phase, w in weights.get('phase', {}).items()})
+    POSITION_WEIGHTS.update(weights.get('position', {}))
+    POSITIONAL_WEIGHT = weights.get('positional', POSITIONAL_WEIGHT)
+    POSITION_VALUES[:] = [round(POSITIONAL_WEIGHT * POSITION_WEIGHTS[pos] * EVAL_SCALE) for pos in POSITIONS]
+    SCALED_PHASE_WEIGHTS.update({phase: tuple(round(w * EVAL_SCALE) for w in weights)
+                                 for phase, weights in PHASE_WEIGHTS.items()})
+    # Square weights that are no longer symmetric change which positions can share table entries
+    PLACEMENT_SYMMETRIES = placement_symmetries()
+
+def load_weights(path):
+    """Use the evaluation weights in a JSON file (written by tuning.py, or by hand in the format of get_weights)"""
+    with open(path) as f:
+        set_weights(json.load(f))
+    Lasker_Morris.eval_cache.clear()
+
+# Late move reductions: from the LMR_FULL_MOVES-th move on, quiet moves at depth LMR_MIN_DEPTH or more are first
+# searched one ply shallower (two from the LMR_LATE_MOVES-th on) and only searched fully if they beat alpha
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 3
+LMR_LATE_MOVES = 10
+# Futility pruning and razoring work up to this depth
+FUTILITY_DEPTH = 2
+# Symmetric transpositions are common while there are only a few stones on the board (the start position is
+# symmetric under every symmetry) and rare after that, so past this many stones the table keys aren't worth the
+# cost of finding the smallest symmetric key
+SYMMETRY_MAX_STONES = 8
+
+# Moves are packed into ints during search: bits 0-4 the source square (HAND for a placement),
+# bits 5-9 the target square, bits 10-14 the removed square and bit 15 set when a stone is removed.
+# They only turn into 'h1 a4 r0' strings at the referee I/O boundary (parse_move/format_move)
+HAND = 24
+MOVE_CAPTURE = 1 << 15
+
+def pack_move(source, target, removed=None):
+    if removed is None:
+        return source | (target << 5)
+    return source | (target << 5) | (removed << 10) | MOVE_CAPTURE
+
+def parse_move(text):
+    """Turn a referee move like 'h1 a4 r0' or 'd1 d2 a4' into a packed move, None if it is malformed"""
+    try:
+        partA, partB, partC = text.split()
+    except ValueError:
+        return None # Move doesn't have 3 parts
+    if partA.startswith('h'):
+        source = HAND
+    elif partA in SQUARE_INDEX:
+        source = SQUARE_INDEX[partA]
+    else:
+        return None
+    if partB not in SQUARE_INDEX:
+        return None
+    if partC == 'r0':
+        return pack_move(source, SQUARE_INDEX[partB])
+    if partC not in SQUARE_INDEX:
+        return None
+    return pack_move(source, SQUARE_INDEX[partB], SQUARE_INDEX[partC])
+
+def format_move(move, player):
+    """Turn a packed move made by player back into the referee's 'h1 a4 r0' format"""
+    source = move & 31
+    if source == HAND:
+        partA = 'h1' if player == 'blue' else 'h2'
+    else:
+        partA = POSITIONS[source]
+    partC = POSITIONS[(move >> 10) & 31] if move & MOVE_CAPTURE else 'r0'
+    return f'{partA} {POSITIONS[(move >> 5) & 31]} {partC}'
+
+# Number of squares in each column group of a position string (see format_position)
+COLUMN_SIZES = (3, 3, 3, 6, 3, 3, 3)
+
+def format_position(state):
+    """
+    Write a state like FEN: the squares column by column (a1 a4 a7 / b2 b4 b6 / ... / g1 g4 g7) with B for blue,
+    O for orange and . for empty, then the side to move (b or o), the stones in hand of blue and orange and the
+    stalemate counter, e.g. BO./.../.../....../.../.../... b 7 8 3 (perft.py reads them back)
+    """
+    board = state.board
+    squares = ''.join('B' if board[pos] == 'blue' else 'O' if board[pos] == 'orange' else '.' for pos in POSITIONS)
+    columns = []
+    start = 0
+    for size in COLUMN_SIZES:
+        columns.append(squares[start:start + size])
+        start += size
+    return f"{'/'.join(columns)} {state.to_move[0]} {state.hand[0]} {state.hand[1]} {state.stalemate_count}"
+
+# Zobrist keys: one random number per (colour, square), per (colour, stones removed), per stalemate count and
+# one for orange to move. A state's key is the XOR of the numbers that apply to it and result() updates it incrementally
+_zobrist_random = random.Random(4341)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(63) for _ in POSITIONS] for _ in PLAYERS]
+ZOBRIST_REMOVED = [[_zobrist_random.getrandbits(63) for _ in range(STONES_PER_PLAYER + 1)] for _ in PLAYERS]
+ZOBRIST_STALEMATE = [_zobrist_random.getrandbits(63) for _ in range(stalemate_threshold + 1)]
+ZOBRIST_ORANGE_TO_MOVE = _zobrist_random.getrandbits(63)
+# Mixed into a key to cache an evaluation made for the player who is not to move
+ZOBRIST_OTHER_VIEW = _zobrist_random.getrandbits(63)
+
+def zobrist_key(state):
+    """Compute the Zobrist key of a state from scratch"""
+    key = ZOBRIST_ORANGE_TO_MOVE if state.to_move == 'orange' else 0
+    for p in range(2):
+        for sq in iter_squares(state.pieces[p]):
+            key ^= ZOBRIST_PIECES[p][sq]
+        key ^= ZOBRIST_REMOVED[p][state.removed[p]]
+    return key ^ ZOBRIST_STALEMATE[min(state.stalemate_count, stalemate_threshold)]
+
+def square_bit(pos):
+    return 1 << SQUARE_INDEX[pos]
+
+def iter_squares(mask):
+    """Yield the index of every set bit in mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+# The 16 board symmetries as square permutations (see symmetry.py), used to fold positions that are the same
+# up to symmetry together in the opening book and the transposition table
+SYMMETRIES = symmetries(POSITIONS)
+INVERSE_SYMMETRIES = [inverse(perm) for perm in SYMMETRIES]
+# The stones' part of a position's Zobrist key under each of the symmetries, packed into one int with 64 bits per
+# symmetry (the identity in the lowest), so that a move updates all of them with a single XOR.
+# ZOBRIST_SYMMETRIC[p][sq] packs the Zobrist numbers of a stone of player index p on sq after every symmetry
+SYMMETRIC_KEYS = struct.Struct(f'<{len(SYMMETRIES)}Q')
+ZOBRIST_SYMMETRIC = [[sum(ZOBRIST_PIECES[p][perm[sq]] << (64 * i) for i, perm in enumerate(SYMMETRIES))
+                      for sq in range(len(POSITIONS))] for p in range(2)]
+
+def symmetric_keys(pieces):
+    """The packed keys of the stones under every symmetry, see ZOBRIST_SYMMETRIC"""
+    keys = 0
+    for p in range(2):
+        for sq in iter_squares(pieces[p]):
+            keys ^= ZOBRIST_SYMMETRIC[p][sq]
+    return keys
+
+def placement_symmetries():
+    """
+    Indices of the symmetries that leave POSITION_VALUES as they are. The rules and every other evaluation term
+    are the same under all 16, but the positional bonus only under these, so they are the only ones the
+    transposition table can fold together while anyone still has stones in hand
+    """
+    return tuple(i for i, perm in enumerate(SYMMETRIES)
+                 if all(POSITION_VALUES[perm[sq]] == POSITION_VALUES[sq] for sq in range(len(POSITIONS))))
+
+PLACEMENT_SYMMETRIES = placement_symmetries()
+
+def search_key(state):
+    """
+    Key of a state (or Position) in the transposition table, and the index of the symmetry that takes the state to
+    the orientation the table stores it in. With use_symmetry and at most SYMMETRY_MAX_STONES stones on the board,
+    this is the smallest of the state's keys under the symmetries that don't change its evaluation, so positions
+    that are the same up to those symmetries share their entry. Otherwise it's the Zobrist key and the identity.
+    Either way the table entry of a key holds its moves in the orientation of the state that key is the Zobrist key of
+    """
+    packed = state.sym_keys
+    if packed is None or state.on_board[0] + state.on_board[1] > SYMMETRY_MAX_STONES:
+        return state.key, 0
+    keys = SYMMETRIC_KEYS.unpack(packed.to_bytes(SYMMETRIC_KEYS.size, 'little'))
+    if state.hand[0] or state.hand[1]:
+        best = min(PLACEMENT_SYMMETRIES, key=keys.__getitem__)
+    else:
+        best = keys.index(min(keys))
+    return state.key ^ keys[0] ^ keys[best], best
+
+def to_table(move, index):
+    """A move of the real position in the orientation of its table entry (search_key's symmetry index)"""
+    return transform_move(move, SYMMETRIES[index]) if index and move else move
+
+def from_table(move, index):
+    """A move stored in the table back in the orientation of the real position, the inverse of to_table"""
+    return transform_move(move, INVERSE_SYMMETRIES[index]) if index and move else move
+
+def transform_move(move, perm):
+    """Apply a square permutation to a packed move"""
+    source = move & 31
+    moved = (source if source == HAND else perm[source]) | (perm[(move >> 5) & 31] << 5)
+    if move & MOVE_CAPTURE:
+        moved |= (perm[(move >> 10) & 31] << 10) | MOVE_CAPTURE
+    return moved
+
+def transform_state(state, perm):
+    """The state with its stones moved by a square permutation"""
+    moved = state._replace(pieces=tuple(transform_mask(bits, perm) for bits in state.pieces))
+    return moved._replace(key=zobrist_key(moved))
+
+def canonical_key(state, symmetries=None):
+    """
+    Exact key of the canonical form of a state: the same for every position that is a symmetry of it, and different
+    for every other position. Also returns the index of a symmetry in SYMMETRIES that maps the state onto that form.
+    symmetries (indices into SYMMETRIES) limits the symmetries that count, all of them by default
+    """
+    if symmetries is None:
+        (blue, orange), i = canonical_pieces(state.pieces[0], state.pieces[1], SYMMETRIES)
+    else:
+        (blue, orange), i = canonical_pieces(state.pieces[0], state.pieces[1], [SYMMETRIES[i] for i in symmetries])
+        i = symmetries[i]
+    key = (blue | (orange << 24) | (state.hand[0] << 48) | (state.hand[1] << 52) |
+           (PLAYER_INDEX[state.to_move] << 56) | (min(state.stalemate_count, stalemate_threshold) << 57))
+    return key, i
+
+#Code from Textbook with some minor modifications
+# pieces, hand, on_board and removed are (blue, orange) pairs; pieces holds one 24-bit mask per colour
+# key is the Zobrist key of the state
+class GameState(namedtuple('GameState', 'to_move, pieces, hand, on_board, removed, stalemate_count, key')):
+
+    @cached_property
+    def sym_keys(self):
+        """symmetric_keys of the stones, None when use_symmetry is off"""
+        return symmetric_keys(self.pieces) if use_symmetry else None
+
+    @cached_property
+    def utility(self):
+        """Value of the state to the player to move, only evaluated the first time something asks for it"""
+        return _rules.utility(self, self.to_move)
+
+    @property
+    def board(self):
+        """Dict view of the board ({'a1': 'blue', 'a4': None, ...}), only meant for display and debugging"""
+        board = {}
+        for i, pos in enumerate(POSITIONS):
+            bit = 1 << i
+            if self.pieces[0] & bit:
+                board[pos] = 'blue'
+            elif self.pieces[1] & bit:
+                board[pos] = 'orange'
+            else:
+                board[pos] = None
+        return board
+
+    @property
+    def mill_terms(self):
+        """Packed mill and potential mill counts of both players, see count_mill_terms"""
+        return count_mill_terms(self.pieces[0], self.pieces[1])
+
+    @property
+    def positional(self):
+        """Sum of POSITION_VALUES under each player's stones, the positional bonus of each player"""
+        return (positional_sum(self.pieces[0]), positional_sum(self.pieces[1]))
+
+    @property
+    def slides(self):
+        """Packed counts of both players' sliding moves, see count_slides"""
+        return count_slides(self.pieces[0], self.pieces[1])
+
+class Position():
+    """
+    Mutable version of a GameState for the search to walk the tree with.
+    make_move applies a move in place and pushes what it needs onto an undo stack, unmake_move takes it back.
+    It has the same fields as GameState (as lists), so the Lasker_Morris methods accept either.
+    The evaluation terms (mill_terms, positional and slides) are kept up to date as moves are made instead of
+    recounted.
+    Moves are trusted to come from Lasker_Morris.actions, use Lasker_Morris.result for anything else
+    """
+    def __init__(self, state):
+        self.to_move = state.to_move
+        self.side = PLAYER_INDEX[state.to_move]
+        self.pieces = list(state.pieces)
+        self.hand = list(state.hand)
+        self.on_board = list(state.on_board)
+        self.removed = list(state.removed)
+        self.stalemate_count = state.stalemate_count
+        self.key = state.key
+        self.sym_keys = state.sym_keys
+        self.mill_terms = state.mill_terms
+        self.positional = list(state.positional)
+        self.slides = state.slides
+        self.undo = []
+
+    def make_move(self, move):
+        p = self.side
+        o = 1 - p
+        pieces = self.pieces
+        source = move & 31
+        target = (move >> 5) & 31
+        count = self.stalemate_count
+        slides = self.slides
+        positional = self.positional
+        sym_keys = self.sym_keys
+        self.undo.append((move, count, self.key, self.mill_terms, slides, positional[0], positional[1], sym_keys))
+        # Updated together, the way terms_around packs them
+        terms = self.mill_terms | (slides << 32)
+        key = self.key ^ ZOBRIST_ORANGE_TO_MOVE
+
+        if move & MOVE_CAPTURE:
+            victim = (move >> 10) & 31
+            terms -= terms_around(pieces, victim)
+            pieces[o] ^= 1 << victim
+            terms += terms_around(pieces, victim)
+            positional[o] -= POSITION_VALUES[victim]
+            self.on_board[o] -= 1
+            removed = self.removed[o]
+            key ^= ZOBRIST_PIECES[o][victim] ^ ZOBRIST_REMOVED[o][removed] ^ ZOBRIST_REMOVED[o][removed + 1]
+            if sym_keys is not None:
+                sym_keys ^= ZOBRIST_SYMMETRIC[o][victim]
+            self.removed[o] = removed + 1
+            self.stalemate_count = 0
+        else:
+            self.stalemate_count = count + 1
+        key ^= (ZOBRIST_STALEMATE[min(count, stalemate_threshold)] ^
+                ZOBRIST_STALEMATE[min(self.stalemate_count, stalemate_threshold)])
+
+        if source == HAND:
+            self.hand[p] -= 1
+            self.on_board[p] += 1
+        else:
+            terms -= terms_around(pieces, source)
+            pieces[p] ^= 1 << source
+            terms += terms_around(pieces, source)
+            positional[p] -= POSITION_VALUES[source]
+            key ^= ZOBRIST_PIECES[p][source]
+            if sym_keys is not None:
+                sym_keys ^= ZOBRIST_SYMMETRIC[p][source]
+        terms -= terms_around(pieces, target)
+        pieces[p] |= 1 << target
+        terms += terms_around(pieces, target)
+        self.mill_terms = terms & 0xFFFFFFFF
+        self.slides = terms >> 32
+        positional[p] += POSITION_VALUES[target]
+        self.key = key ^ ZOBRIST_PIECES[p][target]
+        if sym_keys is not None:
+            self.sym_keys = sym_keys ^ ZOBRIST_SYMMETRIC[p][target]
+
+        self.side = o
+        self.to_move = PLAYERS[o]
+
+    def unmake_move(self):
+        (move, self.stalemate_count, self.key, self.mill_terms, self.slides, blue_positional, orange_positional,
+         self.sym_keys) = self.undo.pop()
+        self.positional[0] = blue_positional
+        self.positional[1] = orange_positional
+        o = self.side
+        p = 1 - o
+        pieces = self.pieces
+        source = move & 31
+        target = (move >> 5) & 31
+
+        if source == HAND:
+            pieces[p] ^= 1 << target
+            self.hand[p] += 1
+            self.on_board[p] -= 1
+        else:
+            pieces[p] ^= (1 << source) | (1 << target)
+
+        if move & MOVE_CAPTURE:
+            pieces[o] |= 1 << ((move >> 10) & 31)
+            self.on_board[o] += 1
+            self.removed[o] -= 1
+
+        self.side = p
+        self.to_move = PLAYERS[p]
+
+    def to_state(self):
+        """Snapshot the position as an immutable GameState"""
+        return GameState(to_move=self.to_move, pieces=tuple(self.pieces), hand=tuple(self.hand),
+                         on_board=tuple(self.on_board), removed=tuple(self.removed),
+                         stalemate_count=self.stalemate_count, key=self.key)
+
 class Lasker_Morris():
     # A list of all mills in the game (plz someone check i definitely couldve missed some)
     # I believe this is good
@@ -31,384 +531,368 @@ class Lasker_Morris():
         ("c5", "d5", "e5"),
         ("e5", "e4", "e3")
     ]
+    # Same mills as bitmasks, and the adjacency of every square as a bitmask
+    MILL_MASKS = [square_bit(a) | square_bit(b) | square_bit(c) for a, b, c in MILL_LIST]
+    ADJACENT_MASKS = [sum(square_bit(adj) for adj in ADJACENT[pos]) for pos in POSITIONS]
+
+    # Static evaluations only depend on the position, so every game object shares one bounded cache
+    eval_cache = EvalCache(eval_cache_mb)
+    # Endgame tablebases the search probes once neither player has stones in hand, loaded by main()
+    tablebases = None
+
     def __init__(self):
         # Board positions
-        self.positions = ["a1", "a4", "a7", "b2", "b4", "b6",
-                          "c3", "c4", "c5", "d1", "d2", "d3",
-                          "d5", "d6", "d7", "e3", "e4", "e5",
-                          "f2", "f4", "f6", "g1", "g4", "g7"]
-        
-        # Initialize the board
-        board = {pos: None for pos in self.positions}
+        self.positions = POSITIONS
 
         # All positions are initially available for placement by both players- only from hand, and no mills
-        # This is in the form of 'h1/h2 a4 r0'
-        moves = [f"{x} {y} {z}" for x in ['h1'] 
-                 for y in self.positions 
-                 for z in ['r0']]
-        
-        removed = {'blue': 0, 'orange': 0}
-        self.initial = GameState(to_move='blue', utility=0, board=board, moves=moves, removed=removed, stalemate_count = 0)
+        self.initial = GameState(to_move='blue', pieces=(0, 0),
+                                 hand=(STONES_PER_PLAYER, STONES_PER_PLAYER), on_board=(0, 0),
+                                 removed=(0, 0), stalemate_count=0, key=0)
+        self.initial = self.initial._replace(key=zobrist_key(self.initial))
 
         # Precompute which mills each position is in
         self.mills_by_position = self.compute_mills_by_position()
 
     def compute_mills_by_position(self):
         """
-        Precomputes mills by position for faster mill checking
+        Precomputes mills by position for faster mill checking, as a list of mill masks per square index
         """
-        mills_by_pos = {pos: [] for pos in self.positions}
-        for mill in Lasker_Morris.MILL_LIST:
-            for pos in mill:
-                mills_by_pos[pos].append(mill)
+        mills_by_pos = [[] for _ in POSITIONS]
+        for mill in Lasker_Morris.MILL_MASKS:
+            for sq in iter_squares(mill):
+                mills_by_pos[sq].append(mill)
         return mills_by_pos
 
+    def forms_mill(self, bits, sq):
+        """True if the stones in bits complete a mill through square sq"""
+        for mill in self.mills_by_position[sq]:
+            if bits & mill == mill:
+                return True
+        return False
+
+    def milled(self, bits):
+        """Mask of every stone in bits that is part of a mill"""
+        milled = 0
+        for mill in Lasker_Morris.MILL_MASKS:
+            if bits & mill == mill:
+                milled |= mill
+        return milled
+
+    def removable(self, opp_bits):
+        """Opponent stones that can be removed after a mill: stones outside mills, or any stone if all are milled"""
+        not_milled = opp_bits & ~self.milled(opp_bits)
+        return not_milled if not_milled else opp_bits
+
     def actions(self, state):
         """Return a list of the legal moves at this point."""
-        # This will depend on a lot of factors:
-        # Current player- blue or orange
-        curPlayer = state.to_move
+        return self.player_moves(state, PLAYER_INDEX[state.to_move])
 
-        # Current players # of stones in hand, on board, removed
-        boardStones = sum(1 for pos, val in state.board.items() if val == curPlayer)
+    def player_moves(self, state, p):
+        """Return the legal moves player index p would have in this state, whether or not it is their turn."""
+        # This will depend on a lot of factors:
+        own = state.pieces[p]
+        opp = state.pieces[1 - p]
 
-        # Unsure how to keep track of # of stones removed? For now, it will be passed as arg
-        stonesRemoved = state.removed[curPlayer]
-        handStones = 10 - (boardStones + stonesRemoved)
+        # Current players # of stones in hand, on board
+        boardStones = state.on_board[p]
+        handStones = state.hand[p]
 
         # If number of stones to play is <=2, other player wins, so return no moves
         if (handStones == 0 and boardStones <= 2):
             return []
 
         # Empty squares on board
-        emptySquares = [pos for pos, occupant in state.board.items() if occupant is None]
+        empty = FULL_BOARD & ~(own | opp)
+
+        # Opponent stones that could be taken if a move closes a mill (only worked out once a mill shows up)
+        removable = None
 
-        # This list will be in ['h1 a4 r0', 'd1 a4 e5'] etc format
+        # This list holds packed moves (see pack_move), 'h1 a4 r0' is pack_move(HAND, 1)
         moves = []
-        
-        # Create moves here:
+
         # If hand > 0, for each empty square:
-        # Add it to moves 'h1/h2 square r0' (and also check for mills)
+        # Add a placement to it (and also check for mills)
         if (handStones > 0):
-            hand = 'h1' if curPlayer == 'blue' else 'h2'
-            for sq in emptySquares:
-                millMoves = self.getMillMoves(state, hand, sq, curPlayer)
-                # if no mill is created:
-                if millMoves is None:
-                    moves.append(f'{hand} {sq} r0')
+            for sq in iter_squares(empty):
+                move = HAND | (sq << 5)
+                if self.forms_mill(own | (1 << sq), sq):
+                    if removable is None:
+                        removable = [(z << 10) | MOVE_CAPTURE for z in iter_squares(self.removable(opp))]
+                    moves.extend(move | z for z in removable)
                 else:
-                    moves.extend(millMoves)
-                
-        # If boardStones > 3
-        # For each current square, check all adjacent squares
-        # Only add move if the adj square is empty
-        # need to check for mills though also
-        if boardStones != 3 and boardStones > 0:
-            pSquares = [pos for pos, occupant in state.board.items() if occupant == curPlayer]
-            for sq in pSquares:
-                # helper to return all adj sq's
-                # then, remove all adjs that are NOT empty
-                adjSqs = [adj for adj in self.adj(sq) if state.board[adj] is None]
-                for adj in adjSqs:
-                    millMoves = self.getMillMoves(state, sq, adj, curPlayer)
-                    if millMoves is None:
-                        moves.append(f'{sq} {adj} r0')
-                    else:
-                        moves.extend(millMoves)
-
-        # If hand == 0, boardStones == 3: pieces can fly
-        # Thus, add all emptySquares 'd1 square r0' (and also check for mills)
-        if boardStones == 3 and handStones == 0:
-            pSquares = [pos for pos, occupant in state.board.items() if occupant == curPlayer]
-            for sq in pSquares:
-                for empty in emptySquares:
-                    millMoves = self.getMillMoves(state, sq, empty, curPlayer)
-                    if millMoves is None:
-                        moves.append(f'{sq} {empty} r0')
+                    moves.append(move)
+
+        # If boardStones > 3 (or we are still placing) slide to adjacent empty squares,
+        # if hand == 0, boardStones == 3: pieces can fly to any empty square
+        if boardStones > 0 and (boardStones != 3 or handStones == 0):
+            flying = boardStones == 3
+            for sq in iter_squares(own):
+                lifted = own & ~(1 << sq)
+                targets = empty if flying else empty & Lasker_Morris.ADJACENT_MASKS[sq]
+                for adj in iter_squares(targets):
+                    move = sq | (adj << 5)
+                    if self.forms_mill(lifted | (1 << adj), adj):
+                        if removable is None:
+                            removable = [(z << 10) | MOVE_CAPTURE for z in iter_squares(self.removable(opp))]
+                        moves.extend(move | z for z in removable)
                     else:
-                        for move in millMoves:
-                            moves.append(move)
+                        moves.append(move)
 
         # This is designed to be exhaustive - send back every single specific valid move
         return moves
 
     def adj(self, pos):
-        # helper function to return all adjacent sqs to sq
-        adjacent = {
-            'a1': ['a4', 'd1'],
-            'a4': ['a1', 'a7', 'b4'],
-            'a7': ['a4', 'd7'],
-            'b2': ['b4', 'd2'],
-            'b4': ['a4', 'b2', 'b6', 'c4'],
-            'b6': ['b4', 'd6'],
-            'c3': ['c4', 'd3'],
-            'c4': ['b4', 'c3', 'c5'],
-            'c5': ['c4', 'd5'],
-            'd1': ['a1', 'd2', 'g1'],
-            'd2': ['b2', 'd1', 'd3', 'f2'],
-            'd3': ['c3', 'd2', 'e3'],
-            'd5': ['c5', 'd6', 'e5'],
-            'd6': ['b6', 'd5', 'd7', 'f6'],
-            'd7': ['a7', 'd6', 'g7'],
-            'e3': ['d3', 'e4'],
-            'e4': ['e3', 'e5', 'f4'],
-            'e5': ['d5', 'e4'],
-            'f2': ['d2', 'f4'],
-            'f4': ['e4', 'f2', 'f6', 'g4'],
-            'f6': ['d6', 'f4'],
-            'g1': ['d1', 'g4'],
-            'g4': ['f4', 'g1', 'g7'],
-            'g7': ['d7', 'g4']
-        }
-        return adjacent.get(pos, [])
+        # helper function to return all adj sqs to sq
+        return ADJACENT.get(pos, [])
 
     def getMillMoves(self, state, current_square, target_square, player):
         # helper function- returns None if no new mill is formed by move
-        # otherwise, returns all possible moves with given 'A B '
-        # first, check if it makes a mill
-        oldBoard = state.board.copy()
-        newBoard = oldBoard.copy()        
-        
-        if current_square.startswith('h'):
-            # Placement move
-            newBoard[target_square] = player
-        else:
-            # Flying move
-            newBoard[target_square] = player
-            newBoard[current_square] = None
-
-        # For placement moves you need the sq, for moving moves you need the target spot
-        target = target_square if current_square.startswith('h') else current_square
+        # otherwise, returns all possible packed moves from current_square (HAND for placements) to target_square
+        p = PLAYER_INDEX[player]
+        own = state.pieces[p]
+        if current_square != HAND:
+            # Moving/flying move, lift the stone first
+            own &= ~(1 << current_square)
 
         # Check for mills that include the target spot
-        mills_involving_target = self.mills_by_position[target]
-        
-        oldMills = [mill for mill in mills_involving_target if all(oldBoard[pos] == player for pos in mill)]
-        newMills = [mill for mill in mills_involving_target if all(newBoard[pos] == player for pos in mill)]
-
-        # If at least one new mill is formed, you need to make a move that removes a piece
-        if any(mill not in oldMills for mill in newMills):
-            opponent = 'orange' if player == 'blue' else 'blue'
-
-            opponent_positions = [pos for pos, mark in newBoard.items() if mark == opponent]
-
-            # get all oppSquares are in mills
-            notMilled = [
-                pos for pos in opponent_positions
-                    if not any(pos in mill and all(newBoard[x] == opponent for x in mill)
-                            for mill in Lasker_Morris.MILL_LIST)
-            ]
-
-            # if all milled, return all moves with oppSquares
-            # otherwise, return all moves with notMilled
-            if not notMilled:
-                return [f'{current_square} {target_square} {z}' for z in opponent_positions]
-            
-            return [f'{current_square} {target_square} {z}' for z in notMilled]
-        return None
-        
+        if not self.forms_mill(own | (1 << target_square), target_square):
+            return None
+
+        # If a new mill is formed, you need to make a move that removes a piece
+        return [pack_move(current_square, target_square, z)
+                for z in iter_squares(self.removable(state.pieces[1 - p]))]
+
     def result(self, state, move):
-        """Return the state that results from making a move from a state."""
-        # Parse the move into 3 parts
-        try:
-            partA, partB, partC = move.split()
-        except ValueError:
-            return "INVALID" # Move doesn't have 3 parts
-        
-        # Create a new board with the new move
-        new_board = state.board.copy()
-        current_player = state.to_move
-        opponent = 'orange' if current_player == 'blue' else 'blue'
-        new_removed = state.removed.copy()
+        """Return the state that results from making a (packed) move from a state."""
+        # Unpack the move into its 3 parts (parse_move gives None for malformed referee input)
+        if move is None:
+            return "INVALID"
+        source = move & 31
+        target = (move >> 5) & 31
+        capture = move & MOVE_CAPTURE
+        if target >= HAND or source > HAND:
+            return "INVALID"
 
-        # If this is a removal move (partC is not r0), remove the piece
-        if partC != "r0":
+        current_player = state.to_move
+        p = PLAYER_INDEX[current_player]
+        o = 1 - p
+        opponent = PLAYERS[o]
+        own = state.pieces[p]
+        opp = state.pieces[o]
+        hand = list(state.hand)
+        on_board = list(state.on_board)
+        removed = list(state.removed)
+
+        target_bit = 1 << target
+        key = state.key ^ ZOBRIST_ORANGE_TO_MOVE
+
+        # If this is a removal move, remove the piece
+        if capture:
             new_stalemate_count = 0
             # Validate that the move is valid
-            if new_board.get(partC) != opponent:
+            victim = (move >> 10) & 31
+            if victim >= HAND or not opp & (1 << victim):
                 return "INVALID"
             # Remove the opponent's piece
-            new_board[partC] = None
-            new_removed[opponent] += 1
+            opp &= ~(1 << victim)
+            on_board[o] -= 1
+            key ^= ZOBRIST_PIECES[o][victim] ^ ZOBRIST_REMOVED[o][removed[o]] ^ ZOBRIST_REMOVED[o][removed[o] + 1]
+            removed[o] += 1
         else:
             new_stalemate_count = state.stalemate_count + 1
+        # (counts past the threshold only show up if play goes on after a draw, they share the last key)
+        key ^= (ZOBRIST_STALEMATE[min(state.stalemate_count, stalemate_threshold)] ^
+                ZOBRIST_STALEMATE[min(new_stalemate_count, stalemate_threshold)])
 
-        # In a placement move, partA is a hand marker and partB is the target
-        # In a moving/flying move, partA is the start and partB is the end
-        # If partA starts with 'h', it's a placement, else it's a flying move
-        if partA.startswith('h'):
+        # In a placement move, the source is HAND
+        # In a moving/flying move, the source is the start square
+        if (own | opp) & target_bit:
+            return "INVALID"
+        if source == HAND:
             # Placement move
-            if new_board.get(partB) is not None:
-                return "INVALID"
-            new_board[partB] = current_player
+            own |= target_bit
+            hand[p] -= 1
+            on_board[p] += 1
         else:
             # Flying move
-            if new_board.get(partA) != current_player or new_board.get(partB) is not None:
+            if not own & (1 << source):
                 return "INVALID"
-            new_board[partA] = None
-            new_board[partB] = current_player
-
-        # Check if a mill was formed
-        mills_involving_target = self.mills_by_position.get(partB, [])
-        # Compute the mills that were present before making the move
-        oldMills = [mill for mill in mills_involving_target if all(state.board.get(pos) == current_player for pos in mill)]
-        # Compute the mills present after making the move
-        newMills = [mill for mill in mills_involving_target if all(new_board.get(pos) == current_player for pos in mill)]
+            own = (own & ~(1 << source)) | target_bit
+            key ^= ZOBRIST_PIECES[p][source]
+        key ^= ZOBRIST_PIECES[p][target]
+
         # If a new mill is formed but no removal was specified, the move is invalid
-        if any(mill not in oldMills for mill in newMills) and partC == "r0":
+        # (the target was empty before the move, so any mill through it is new)
+        if not capture and self.forms_mill(own, target):
             return "INVALID"
-            
-        # Remove the move from the list of available moves
-        new_moves = [m for m in state.moves if m != move]
+
+        pieces = (own, opp) if p == 0 else (opp, own)
 
         # Switch to the other player
         next_player = opponent
 
-        # Create a new state with a utility of 0 then update it by using the utility function
-        new_state = GameState(to_move=next_player, utility=0, board=new_board, moves=new_moves, removed=new_removed, stalemate_count=new_stalemate_count)
-        new_state = new_state._replace(utility=self.utility(new_state, new_state.to_move))
+        # Create the new state, its utility is only worked out if someone asks for it
+        return GameState(to_move=next_player, pieces=pieces, hand=tuple(hand),
+                         on_board=tuple(on_board), removed=tuple(removed),
+                         stalemate_count=new_stalemate_count, key=key)
 
-        return new_state
-
-    def utility(self, state, player):
-        """Return the value of this final state to player."""
-
-        opponent = 'blue' if player == 'orange' else 'blue'
+    def count_moves(self, state, p):
+        """
+        Return len(self.player_moves(state, p)) without building the list.
+        Every move adds one, except moves that close a mill which add one per removable stone
+        """
+        own = state.pieces[p]
+        opp = state.pieces[1 - p]
+        boardStones = state.on_board[p]
+        handStones = state.hand[p]
+        if (handStones == 0 and boardStones <= 2):
+            return 0
+
+        empty = FULL_BOARD & ~(own | opp)
+        placing = handStones > 0
+        sliding = boardStones > 0 and (boardStones != 3 or handStones == 0)
+        flying = boardStones == 3
+
+        count = empty.bit_count() if placing else 0
+        if sliding:
+            if flying:
+                count += boardStones * empty.bit_count()
+            else:
+                count += (state.slides >> (8 * p)) & 0xFF
+
+        # Mill closing moves only exist if the player has a potential mill (2 stones and a gap)
+        potential = (state.mill_terms >> (16 + 8 * p)) & 0xFF
+        if not potential:
+            return count
+
+        # For every gap that closes a mill, the stones that can close it (any stone outside that mill)
+        closers = {}
+        for mill in Lasker_Morris.MILL_MASKS:
+            gap = mill & ~own
+            if gap & empty and not gap & (gap - 1):
+                closers[gap] = closers.get(gap, 0) | (own & ~mill)
+
+        closing = len(closers) if placing else 0
+        if sliding:
+            for gap, stones in closers.items():
+                if not flying:
+                    stones &= Lasker_Morris.ADJACENT_MASKS[gap.bit_length() - 1]
+                closing += stones.bit_count()
+
+        # Each closing move was counted once already, it really comes once per removable stone
+        return count + (self.removable(opp).bit_count() - 1) * closing if closing else count
+
+    def mill_threats(self, state, p):
+        """Mask of the empty squares where player index p could close a mill with their next move"""
+        own = state.pieces[p]
+        # No potential mill (2 stones and a gap), no threat
+        if not (state.mill_terms >> (16 + 8 * p)) & 0xFF:
+            return 0
+        empty = FULL_BOARD & ~(own | state.pieces[1 - p])
+        boardStones = state.on_board[p]
+        placing = state.hand[p] > 0
+        sliding = boardStones > 0 and (boardStones != 3 or not placing)
+        flying = boardStones == 3
+
+        threats = 0
+        for mill in Lasker_Morris.MILL_MASKS:
+            gap = mill & ~own
+            if not gap & empty or gap & (gap - 1) or threats & gap:
+                continue
+            if placing:
+                threats |= gap
+            elif sliding:
+                stones = own & ~mill
+                if not flying:
+                    stones &= Lasker_Morris.ADJACENT_MASKS[gap.bit_length() - 1]
+                if stones:
+                    threats |= gap
+        return threats
+
+    def futility_margin(self, state, depth):
+        """
+        How far depth plies of quiet moves could plausibly lift the evaluation for the side to move:
+        a mill and a potential mill per ply, at the weights of their phase
+        """
+        weight_mills, weight_potential, _, _ = SCALED_PHASE_WEIGHTS[self.phase(state, PLAYER_INDEX[state.to_move])]
+        return depth * (weight_mills + weight_potential)
+
+    def phase(self, state, p):
+        """Game phase of player index p: 'placement' while they have stones in hand, then 'moving' or 'flying'"""
+        if state.hand[p] > 0:
+            return 'placement'
+        elif state.on_board[p] == 3:
+            return 'flying'
+        return 'moving'
+
+    def evaluate(self, state, player):
+        """
+        utility() in integer tenths of a point (see EVAL_SCALE), which is what the search works with.
+        Mill, piece and positional terms and the sliding moves are read off the state (kept incrementally on a
+        Position), and both players' legal moves are counted once and shared by the terminal test and mobility
+        """
+        p = PLAYER_INDEX[player]
+        o = 1 - p
+        moves_player = self.count_moves(state, p)
+        moves_opponent = self.count_moves(state, o)
 
         # If the game is over, return a high or low value
-        if self.terminal_test(state):
-            if self.check_win(state, player):
-                return 1000
-            elif self.check_win(state, opponent):
-                return -1000
+        if state.stalemate_count == stalemate_threshold or (moves_player if state.to_move == player else moves_opponent) == 0:
+            if state.on_board[o] < 3 or moves_opponent == 0:
+                return WIN_SCORE
+            elif state.on_board[p] < 3 or moves_player == 0:
+                return -WIN_SCORE
             elif state.stalemate_count == stalemate_threshold:
                 return 0
-        
-        # Determine the game phase
-        boardStones = sum(1 for pos in state.board if state.board[pos] == player)
-        handStones = 10 - (boardStones + state.removed[player])
-        if handStones > 0:
-            phase = 'placement'
-        elif boardStones == 3:
-            phase = 'flying'
-        else:
-            phase = 'moving'
 
-        # Set weights based on the game phase, weights are pretty arbitrary and are just my best guess
-        if phase == 'placement':
-            weight_mills = 20
-            weight_potential = 14
-            weight_pieces = 5
-            weight_moves = 0.5
-        elif phase == 'moving':
-            weight_mills = 15
-            weight_potential = 6
-            weight_pieces = 2
-            weight_moves = 1
-        else: # flying phase
-            weight_mills = 10
-            weight_potential = 4
-            weight_pieces = 2.5
-            weight_moves = 1.5
-
-        # Optimal board position weights during the placement phase, weights are pretty arbitrary and are just my best guess
-        position_weights = {
-            # Row 1
-            "a1": 0.8,
-            "d1": 1.0,
-            "g1": 0.8,
-
-            # Row 2
-            "b2": 1.0,
-            "d2": 1.4, # Next to d3 intersection
-            "f2": 1.0,
-
-            # Row 3
-            "c3": 1.2, # Corner of inner square
-            "d3": 2.5, # Intersection
-            "e3": 1.2, # Corner of inner square
-
-            # Row 4
-            "a4": 1.0,
-            "b4": 1.4, # Next to c4 intersection
-            "c4": 2.5, # Intersection
-            "e4": 2.5, # Intersection
-            "f4": 1.4, # Next to e4 intersection
-            "g4": 1.0,
-
-            # Row 5
-            "c5": 1.2, # Corner of inner square
-            "d5": 2.5, # Intersection
-            "e5": 1.2, # Corner of inner square
-
-            # Row 6
-            "b6": 1.0,
-            "d6": 1.4, # Next to d5 intersection
-            "f6": 1.0,
-
-            # Row 7
-            "a7": 0.8,
-            "d7": 1.0,
-            "g7": 0.8
-        }
+        # Determine the game phase
+        phase = self.phase(state, p)
+        weight_mills, weight_potential, weight_pieces, weight_moves = SCALED_PHASE_WEIGHTS[phase]
 
         # Compute positional bonus during placement phase
         if phase == 'placement':
-            positional_player = sum(position_weights.get(pos, 1.0) for pos in state.board if state.board[pos] == player)
-            positional_opponent = sum(position_weights.get(pos, 1.0) for pos in state.board if state.board[pos] == opponent)
-            pos_score = 4 * (positional_player - positional_opponent)
+            positional = state.positional
+            pos_score = positional[p] - positional[o]
         else:
             pos_score = 0
 
-        # Count the number of mills for each player
-        mills_player = 0
-        mills_opponent = 0
-        for mill in Lasker_Morris.MILL_LIST:
-            if all(state.board[pos] == player for pos in mill):
-                mills_player += 1
-            elif all(state.board[pos] == opponent for pos in mill):
-                mills_opponent += 1
-
-        # Count potential mills (2 in a row with one empty spot)
-        potential_mills_player = 0
-        potential_mills_opponent = 0
-        for mill in Lasker_Morris.MILL_LIST:
-            pieces_player = sum(1 for pos in mill if state.board[pos] == player)
-            pieces_opponent = sum(1 for pos in mill if state.board[pos] == opponent)
-            empty = sum(1 for pos in mill if state.board[pos] is None)
-            if pieces_player == 2 and empty == 1:
-                potential_mills_player += 1
-            if pieces_opponent == 2 and empty == 1:
-                potential_mills_opponent += 1
-
-        # Count the number of pieces for each player
-        pieces_player = sum(1 for pos in state.board if state.board[pos] == player)
-        pieces_opponent = sum(1 for pos in state.board if state.board[pos] == opponent)
-
-        # Count the number of legal moves available for each player
-        legal_moves_player = len(self.actions(state))
-
-        opponent_state = state._replace(to_move=opponent)
-        legal_moves_opponent = len(self.actions(opponent_state))
+        # Mills and potential mills (2 in a row with one empty spot) for each player
+        terms = state.mill_terms
+        mills = (terms & 0xFF) - ((terms >> 8) & 0xFF)
+        potential_mills = ((terms >> 16) & 0xFF) - (terms >> 24)
+        if p == 1:
+            mills = -mills
+            potential_mills = -potential_mills
 
         # Combine the values into a single score (very mill focused)
-        score = (weight_mills * (mills_player - mills_opponent) +
-                weight_potential * (potential_mills_player - potential_mills_opponent) +
-                weight_pieces * (pieces_player - pieces_opponent) +
-                weight_moves * (legal_moves_player - legal_moves_opponent) +
+        return (weight_mills * mills +
+                weight_potential * potential_mills +
+                weight_pieces * (state.on_board[p] - state.on_board[o]) +
+                weight_moves * (moves_player - moves_opponent) +
                 pos_score)
-        
-        return score
-    
-    def check_mill(self, board, pos, player):
+
+    def cached_evaluate(self, state, player):
+        """evaluate() through the evaluation cache, keyed by the state's key and whose point of view it is"""
+        if state.stalemate_count > stalemate_threshold:
+            # Past the threshold all counts share one key, so don't trust the cache
+            return self.evaluate(state, player)
+        key = state.key if player == state.to_move else state.key ^ ZOBRIST_OTHER_VIEW
+        value = self.eval_cache.get(key)
+        if value is None:
+            value = self.evaluate(state, player)
+            self.eval_cache.put(key, value)
+        return value
+
+    def utility(self, state, player):
+        """Return the value of this final state to player."""
+        return self.cached_evaluate(state, player) / EVAL_SCALE
+
+    def check_mill(self, bits, pos):
         """
-        Check if the move at a given position forms a mill for the player
+        Check if the stones in bits form a mill through a given position, returns the mills formed
         """
-        mills_formed = []
-        for mill in Lasker_Morris.MILL_LIST:
-            if pos in mill and all(board[p] == player for p in mill):
-                mills_formed.append(mill)
-        return mills_formed
+        return [mill for mill, mask in zip(Lasker_Morris.MILL_LIST, Lasker_Morris.MILL_MASKS)
+                if pos in mill and bits & mask == mask]
 
     def check_win(self, state, player):
         """
@@ -416,26 +900,22 @@ class Lasker_Morris():
         """
         # Determine the opponent
         opponent = 'orange' if player == 'blue' else 'blue'
-        
+
         # Count opponents pieces on the board
-        opp_pieces = sum(1 for pos in state.board if state.board[pos] == opponent)
-        if opp_pieces < 3:
+        if state.on_board[PLAYER_INDEX[opponent]] < 3:
             return True
-        
-        # Create a simulated state where its the opponents turn to check their moves
-        opponent_state = state._replace(to_move=opponent)
-        
-        # If the opponent has no moves left they lose
-        if len(self.actions(opponent_state)) == 0:
+
+        # If the opponent has no moves left they lose (checked as if it were their turn)
+        if self.count_moves(state, PLAYER_INDEX[opponent]) == 0:
             return True
-        
+
         return False
 
     def terminal_test(self, state):
         """Return True if this is a final state for the game."""
         if state.stalemate_count == stalemate_threshold:
             return True
-        return not self.actions(state)
+        return self.count_moves(state, PLAYER_INDEX[state.to_move]) == 0
 
     def to_move(self, state):
         """Return the player whose move it is in this state."""
@@ -448,169 +928,789 @@ class Lasker_Morris():
     def __repr__(self):
         return '<{}>'.format(self.__class__.__name__)
 
-def memoize_states(state):
-    # Memoize the state's board, removed counts, and turn
-    board_tuple = tuple(sorted(state.board.items()))
-    removed_tuple = tuple(sorted(state.removed.items()))
-    return (state.to_move, board_tuple, removed_tuple)
+# Rules object behind the lazy GameState.utility
+_rules = Lasker_Morris()
+
+# Evaluation tables. Mill terms are packed into one int, 8 bits each for blue mills, orange mills,
+# blue potential mills and orange potential mills, so a change to the board is a single add/subtract
+MILL_MASKS = Lasker_Morris.MILL_MASKS
+MILLS_BY_SQUARE = [[mill for mill in MILL_MASKS if mill >> sq & 1] for sq in range(len(POSITIONS))]
+MILL_UNION = [mills[0] | mills[1] for mills in MILLS_BY_SQUARE]
+
+def count_mill_terms(blue, orange, mills=MILL_MASKS):
+    """Packed mill and potential mill counts over the given mills"""
+    terms = 0
+    for mill in mills:
+        b = (blue & mill).bit_count()
+        o = (orange & mill).bit_count()
+        if b == 3:
+            terms += 1
+        elif o == 3:
+            terms += 1 << 8
+        elif b == 2 and o == 0:
+            terms += 1 << 16
+        elif o == 2 and b == 0:
+            terms += 1 << 24
+    return terms
+
+def positional_sum(bits):
+    return sum(POSITION_VALUES[sq] for sq in iter_squares(bits))
+
+def submasks(mask):
+    sub = mask
+    while True:
+        yield sub
+        if not sub:
+            return
+        sub = (sub - 1) & mask
+
+# Sliding moves are packed the same way, 8 bits each for blue and orange: one per stone and empty square next
+# to it. The mill closing ones count once here, count_moves adds the extra stones they can remove
+ADJACENT_MASKS = Lasker_Morris.ADJACENT_MASKS
+
+def count_slides(blue, orange):
+    """Packed sliding move counts of both players"""
+    empty = FULL_BOARD & ~(blue | orange)
+    return (sum((ADJACENT_MASKS[sq] & empty).bit_count() for sq in iter_squares(blue)) +
+            (sum((ADJACENT_MASKS[sq] & empty).bit_count() for sq in iter_squares(orange)) << 8))
+
+def slides_around(blue, orange, sq):
+    """Packed sliding move counts of the moves onto or off sq"""
+    adjacent = ADJACENT_MASKS[sq]
+    bit = 1 << sq
+    if blue & bit:
+        return (adjacent & ~(blue | orange)).bit_count()
+    if orange & bit:
+        return (adjacent & ~(blue | orange)).bit_count() << 8
+    return (adjacent & blue).bit_count() + ((adjacent & orange).bit_count() << 8)
+
+# For every square, the packed terms of the two mills through it for every way of filling those mills, with the
+# sliding moves onto and off the square above them from bit 32 (the squares next to it are all on those mills)
+SQUARE_TERMS = [{blue | (orange << 24): count_mill_terms(blue, orange, MILLS_BY_SQUARE[sq]) |
+                 (slides_around(blue, orange, sq) << 32)
+                 for blue in submasks(MILL_UNION[sq]) for orange in submasks(MILL_UNION[sq] & ~blue)}
+                for sq in range(len(POSITIONS))]
+
+def terms_around(pieces, sq):
+    """Packed terms of the two mills through sq and the sliding moves onto and off it"""
+    union = MILL_UNION[sq]
+    return SQUARE_TERMS[sq][(pieces[0] & union) | ((pieces[1] & union) << 24)]
+
+class SearchStats():
+    """
+    Counters of a search. nodes (the main search) and qnodes (the quiescence search past its horizon)
+    are always counted. The rest are only counted when counters is True: alpha_beta_search then swaps in
+    counting versions of actions, the evaluation and the table probe, so a search without them runs the same code
+    as before and only pays for an extra test where a node is cut off
+    """
+    COUNTERS = ('tt_probes', 'tt_hits', 'tt_cutoffs', 'beta_cutoffs', 'first_move_cutoffs', 'actions_calls',
+                'utility_calls', 'eval_cache_hits')
+
+    def __init__(self, counters=False):
+        self.counters = counters
+        self.nodes = 0
+        self.qnodes = 0
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.depth = 0 # Deepest finished iteration
+        self.iteration_times = [] # Seconds taken by every iteration, the last one may be unfinished
+
+    def add(self, other):
+        """Count another search's work as part of this one, like a ponder search that turned into our move"""
+        self.nodes += other.nodes
+        self.qnodes += other.qnodes
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.depth = max(self.depth, other.depth)
+        self.iteration_times.extend(other.iteration_times)
+
+    def as_dict(self):
+        counts = {name: getattr(self, name) for name in ('depth', 'nodes', 'qnodes') + self.COUNTERS}
+        counts['iteration_times'] = [round(t, 4) for t in self.iteration_times]
+        return counts
+
+def alpha_beta_deepening_search(state, game, max_depth=None, timer=None, tt=None, first_depth=1, stats=None):
+    """
+    Iterative deepening: search depth first_depth, first_depth + 1, ... and play the best move of the deepest finished depth.
+    timer (a TimeManager) decides when to stop, without one the search only stops at max_depth.
+    An iteration cut off by the timer is thrown away completely.
+    tt can be passed in to keep the transposition table between searches, otherwise every search gets a new one.
+    A kept table usually already holds a line from the position (the rest of the last search's principal variation,
+    or what a ponder search found), which is searched first from the first iteration on.
+    stats (a SearchStats) collects the counters of every iteration, the depth reached and the time of each iteration
+    """
+    if timer is None and max_depth is None:
+        timer = TimeManager(time_limit, safe_margin)
+    if timer is not None:
+        timer.start(game.phase(state, PLAYER_INDEX[state.to_move]))
+
+    # Nothing to think about with zero or one legal move
+    actions = game.actions(state)
+    if len(actions) <= 1:
+        return actions[0] if actions else None
+    # Nor in an endgame the tablebases already know, deepening would only go on until the time is up
+    if game.tablebases is not None and not (state.hand[0] or state.hand[1]):
+        move = tablebase_move(game.tablebases, state, game)
+        if move is not None:
+            return move
 
-def alpha_beta_deepening_search(state, game):
-    start_time = time()
-    safe_margin = 0.02  # Send the move 0.02 seconds before the time limit
     best_action = None
-    depth = 1
-    memo_states = {} # Store the state and its values at a certain depth
-
-    # Continue deepening until we hit the time limit
-    while time() - start_time < time_limit - safe_margin:
-        current_best = alpha_beta_search(state, game, depth, start_time, memo_states, safe_margin)
-        if current_best is not None:
-            best_action = current_best
+    scores = {} # Score of every finished depth
+    depth = first_depth
+    orderer = MoveOrderer(MOVE_CAPTURE) # Killers, history and the last PV carry over between iterations
+    if tt is None:
+        tt = TranspositionTable(tt_size_mb) # Store the state and its values at a certain depth
+    else:
+        orderer.pv = principal_variation(state, tt, MAX_PLY)
+
+    # Continue deepening until we run out of time (or depth)
+    while max_depth is None or depth <= max_depth:
+        if timer is not None and depth > first_depth and not timer.can_start_iteration():
+            break
+        if timer is not None:
+            timer.start_iteration()
+        if stats is not None:
+            iteration_start = time()
+        # Search a window around the score of the last depth with the same parity first (scores swing between
+        # odd and even depths, whoever moved last looks better), and widen it whenever the score falls outside
+        score = scores.get(depth - 2)
+        if score is None or abs(score) >= WIN_SCORE:
+            alpha, beta = -math.inf, math.inf
+        else:
+            alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+        delta = ASPIRATION_WINDOW
+        try:
+            while True:
+                current_best, value = alpha_beta_search(state, game, depth, tt, orderer, alpha, beta, timer, stats)
+                if value <= alpha:
+                    # Failed low, the returned move is no better than the others
+                    alpha = -math.inf if delta >= MAX_ASPIRATION else alpha - delta
+                elif value >= beta:
+                    beta = math.inf if delta >= MAX_ASPIRATION else beta + delta
+                else:
+                    scores[depth] = value
+                    break
+                delta *= 2
+        except SearchTimeout:
+            if stats is not None:
+                stats.iteration_times.append(time() - iteration_start)
+            break
+        if timer is not None:
+            timer.end_iteration()
+        if stats is not None:
+            stats.iteration_times.append(time() - iteration_start)
+            stats.depth = depth
+        best_action = current_best
+        orderer.pv = principal_variation(state, tt, depth)
         depth += 1
 
     if best_action is None:
-        actions = game.actions(state)
-        if actions:
-            best_action = actions[0]
+        best_action = actions[0]
 
     return best_action
 
-def alpha_beta_search(state, game, depth, start_time, memo_states, safe_margin):
+def principal_variation(state, tt, length):
+    """Follow the transposition table's best moves from state, up to length moves"""
+    pos = Position(state)
+    pv = []
+    while len(pv) < length:
+        key, sym = search_key(pos)
+        entry = tt.probe(key)
+        if entry is None or not entry[3]:
+            break
+        move = from_table(entry[3], sym)
+        pv.append(move)
+        pos.make_move(move)
+    return pv
+
+def alpha_beta_search(state, game, depth, tt, orderer=None, alpha=-math.inf, beta=math.inf, timer=None, stats=None):
     """Search game to determine best action; use alpha-beta pruning.
-    As in [Figure 5.7], this version searches all the way to the leaves."""
+    This is a negamax principal variation search: the first (best ordered) move of a node gets the full
+    (alpha, beta) window and the rest are only checked against alpha with a null window, then searched
+    again with the full window if they turn out better. Values are utility() for the player at the root,
+    negated at the nodes where the other player is to move.
+    Past the horizon a quiescence search keeps going through mill closing moves and blocks of the opponent's
+    mill threats, so the leaves that get evaluated don't have a capture hanging.
+    Returns (best action, its value), the value is only a bound if it falls outside (alpha, beta).
+    If timer runs out it raises SearchTimeout from the middle of the tree, nothing half searched gets stored"""
 
     player = game.to_move(state)
-    
-    # Sort moves that remove an opponent piece to the beginning
-    def order_moves(moves, reverse=False):
-        return sorted(moves, key=lambda move: 1 if move.split()[2] != "r0" else 0, reverse=reverse)
-    
-    def max_value_ab(state, alpha, beta, depth):
-        # Check if we are near the time limit
-        if time() - start_time > time_limit - safe_margin:
-            return game.utility(state, player)
-        
-        # Check if the state is terminal or if we have reached the root
-        if game.terminal_test(state) or depth <= 0:
-            return game.utility(state, player)
-        
-        # If the state has already been evaluated at this depth, return the value
-        state_key = memoize_states(state)
-        if state_key in memo_states and memo_states[state_key][1] >= depth:
-            return memo_states[state_key][0]
-        
-        v = -math.inf
-        # Check high utility first
-        for a in order_moves(game.actions(state), reverse=True):
-            if time() - start_time > time_limit - safe_margin:
-                break
-            result_state = game.result(state, a)
-            if result_state == "INVALID":
-                continue
-            # Recursively call min_value
-            v = max(v, min_value_ab(result_state, alpha, beta, depth - 1))
-            # Beta pruning
-            if v >= beta:
-                memo_states[state_key] = (v, depth) # Cache the value
-                return v
-            alpha = max(alpha, v)
-        memo_states[state_key] = (v, depth) # Cache the value
+    pos = Position(state)
+    root_side = pos.side
+    if orderer is None:
+        orderer = MoveOrderer(MOVE_CAPTURE)
+    pv = orderer.pv
+    tick = timer.tick if timer is not None else lambda: None
+    tablebases = game.tablebases
+    if stats is None:
+        stats = SearchStats()
+    counting = stats.counters
+    actions = game.actions
+    evaluate = game.cached_evaluate
+    probe = tt.probe
+    if counting:
+        def actions(state):
+            stats.actions_calls += 1
+            return game.actions(state)
+
+        def evaluate(state, player):
+            stats.utility_calls += 1
+            key = state.key if player == state.to_move else state.key ^ ZOBRIST_OTHER_VIEW
+            if state.stalemate_count <= stalemate_threshold and game.eval_cache.get(key) is not None:
+                stats.eval_cache_hits += 1
+            return game.cached_evaluate(state, player)
+
+        def probe(key):
+            stats.tt_probes += 1
+            entry = tt.probe(key)
+            if entry is not None:
+                stats.tt_hits += 1
+            return entry
+
+    def leaf_value():
+        value = evaluate(pos, player)
+        return value if pos.side == root_side else -value
+
+    def quiesce(alpha, beta, ply, qply):
+        tick()
+        stats.qnodes += 1
+
+        # The side to move can always stand pat, which also scores positions where the game is over
+        stand_pat = leaf_value()
+        if stand_pat >= beta or qply >= quiescence_depth or pos.stalemate_count == stalemate_threshold:
+            return stand_pat
+        # Nothing to capture without a potential mill of our own, nothing to block without one of theirs
+        terms = pos.mill_terms
+        if not (terms >> 16) & 0xFF and not terms >> 24:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        threats = game.mill_threats(pos, 1 - pos.side)
+        tactical = [a for a in actions(pos) if a & MOVE_CAPTURE or threats >> ((a >> 5) & 31) & 1]
+        v = stand_pat
+        for a in orderer.order(tactical, ply, pos.side):
+            pos.make_move(a)
+            value = -quiesce(-beta, -alpha, ply + 1, qply + 1)
+            pos.unmake_move()
+            if value > v:
+                v = value
+                if v > alpha:
+                    alpha = v
+                    if alpha >= beta:
+                        break
         return v
 
-    def min_value_ab(state, alpha, beta, depth):
-        # Check if we are near the time limit
-        if time() - start_time > time_limit - safe_margin:
-            return game.utility(state, player)
-        
-        # Check if the state is terminal or if we have reached the root
-        if game.terminal_test(state) or depth <= 0:
-            return game.utility(state, player)
-        
-        # If the state has already been evaluated at this depth, return the value
-        state_key = memoize_states(state)
-        if state_key in memo_states and memo_states[state_key][1] >= depth:
-            return memo_states[state_key][0]
-        
-        v = math.inf
-        # Check low utility moves first
-        for a in order_moves(game.actions(state), reverse=False):
-            if time() - start_time > time_limit - safe_margin:
-                break
-            result_state = game.result(state, a)
-            if result_state == "INVALID":
+    def pvs(alpha, beta, depth, ply, on_pv):
+        # Count the node, the timer checks the clock every so often
+        tick()
+        stats.nodes += 1
+
+        # Check if we have reached the root or a stalemate (positions with no moves are caught below)
+        if pos.stalemate_count == stalemate_threshold:
+            return leaf_value()
+
+        # Endgames with nothing in hand can have an exact score in the tablebases
+        if tablebases is not None and not (pos.hand[0] or pos.hand[1]):
+            score = tablebase_score(tablebases, pos)
+            if score is not None:
+                return score
+
+        if depth <= 0:
+            return quiesce(alpha, beta, ply, 0) if quiescence_depth else leaf_value()
+
+        # If the state has already been searched at least this deep, use the stored value or bound
+        alpha_orig = alpha
+        key, sym = search_key(pos)
+        entry = probe(key)
+        tt_move = 0
+        if entry is not None:
+            entry_depth, bound, value, tt_move = entry
+            tt_move = from_table(tt_move, sym)
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    if counting:
+                        stats.tt_cutoffs += 1
+                    return value
+                if bound == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    if counting:
+                        stats.tt_cutoffs += 1
+                    return value
+
+        moves = actions(pos)
+        if not moves:
+            return leaf_value()
+        pv_move = pv[ply] if on_pv and ply < len(pv) else 0
+
+        # Near the leaves of a null window search, give up on nodes that are far below alpha,
+        # unless a win or loss is in sight
+        futile = False
+        if (depth <= FUTILITY_DEPTH and beta - alpha <= 1 and abs(alpha) < WIN_SCORE // 2
+                and (use_razoring or use_futility)):
+            static = leaf_value()
+            margin = game.futility_margin(pos, depth)
+            if use_razoring and static + 2 * margin <= alpha:
+                value = quiesce(alpha, beta, ply, 0) if quiescence_depth else static
+                if value <= alpha:
+                    return value
+            # Quiet moves can't make up the difference, only search captures
+            futile = use_futility and static + margin <= alpha
+
+        v = -math.inf
+        best_move = 0
+        searched = 0
+        potential = pos.mill_terms >> 16
+        for a in orderer.order(moves, ply, pos.side, tt_move, pv_move):
+            if futile and best_move and not a & MOVE_CAPTURE:
                 continue
-            # Recursively call max_value
-            v = min(v, max_value_ab(result_state, alpha, beta, depth - 1))
-            # Alpha pruning
-            if v <= alpha:
-                memo_states[state_key] = (v, depth) # Cache the value
-                return v
-            beta = min(beta, v)
-        memo_states[state_key] = (v, depth) # Cache the value
+            pos.make_move(a)
+            if best_move == 0:
+                value = -pvs(-beta, -alpha, depth - 1, ply + 1, on_pv and a == pv_move)
+            else:
+                # Late quiet moves are scouted a ply or two shallower first,
+                # except ones that make or break a potential mill
+                reduction = 0
+                if (use_lmr and depth >= LMR_MIN_DEPTH and searched >= LMR_FULL_MOVES and not a & MOVE_CAPTURE
+                        and pos.mill_terms >> 16 == potential):
+                    reduction = 1 if searched < LMR_LATE_MOVES else 2
+                # Scout with a null window, only search properly if the move beats alpha
+                value = -pvs(-alpha - 1, -alpha, depth - 1 - reduction, ply + 1, False)
+                if reduction and value > alpha:
+                    value = -pvs(-alpha - 1, -alpha, depth - 1, ply + 1, False)
+                if alpha < value < beta:
+                    value = -pvs(-beta, -alpha, depth - 1, ply + 1, False)
+            pos.unmake_move()
+            searched += 1
+            if value > v:
+                v = value
+                best_move = a
+                if v > alpha:
+                    alpha = v
+                    if alpha >= beta:
+                        orderer.cutoff(a, ply, depth, pos.side)
+                        if counting:
+                            stats.beta_cutoffs += 1
+                            if searched == 1:
+                                stats.first_move_cutoffs += 1
+                        break
+        if futile:
+            # The skipped moves are worth at most static + margin, which is no better than alpha
+            v = max(v, static + margin)
+        # Cache the value, with the kind of bound it is
+        bound = UPPER if v <= alpha_orig else LOWER if v >= beta else EXACT
+        tt.store(key, depth, bound, v, to_table(best_move, sym))
         return v
 
+    alpha_orig = alpha
     best_score = -math.inf
-    beta = math.inf
     best_action = None
-    for a in order_moves(game.actions(state), reverse=True):
-        # Check if we are near the time limit
-        if time() - start_time > time_limit - safe_margin:
-            break
-        result_state = game.result(state, a)
-        if result_state == "INVALID":
-            continue
-        v = min_value_ab(result_state, best_score, beta, depth - 1)
+    pv_move = pv[0] if pv else 0
+    tick()
+    stats.nodes += 1
+    for a in orderer.order(actions(pos), 0, pos.side, 0, pv_move):
+        pos.make_move(a)
+        if best_action is None:
+            v = -pvs(-beta, -alpha, depth - 1, 1, a == pv_move)
+        else:
+            v = -pvs(-alpha - 1, -alpha, depth - 1, 1, False)
+            if alpha < v < beta:
+                v = -pvs(-beta, -alpha, depth - 1, 1, False)
+        pos.unmake_move()
         # Keep the best action
         if v > best_score:
             best_score = v
             best_action = a
-    return best_action
+            if v > alpha:
+                alpha = v
+                if alpha >= beta:
+                    break
+    if best_action is not None:
+        bound = UPPER if best_score <= alpha_orig else LOWER if best_score >= beta else EXACT
+        key, sym = search_key(pos)
+        tt.store(key, depth, bound, best_score, to_table(best_action, sym))
+    return best_action, best_score
+
+def tablebase_score(tablebases, pos):
+    """
+    Exact score for the side to move of a position where neither player has stones in hand,
+    or None if there's no table for its stone counts
+    """
+    p = PLAYER_INDEX[pos.to_move]
+    entry = tablebases.probe(pos.pieces[p], pos.pieces[1 - p])
+    if entry is None:
+        return None
+    # A win or loss that takes more moves than the stalemate counter allows is a draw
+    if entry == 0 or stalemate_threshold - pos.stalemate_count < abs(entry):
+        return 0
+    # Quicker wins and slower losses score better
+    return WIN_SCORE - entry if entry > 0 else -WIN_SCORE - entry
+
+def tablebase_move(tablebases, state, game):
+    """
+    Best move by the tablebases in a position where neither player has stones in hand, or None if a move
+    leads to a position without a table. Moves that score the same are told apart by the static evaluation,
+    so a drawn endgame is played out with the move the opponent is most likely to go wrong after
+    """
+    pos = Position(state)
+    player = state.to_move
+    best_move, best = None, None
+    for move in game.actions(pos):
+        pos.make_move(move)
+        if game.terminal_test(pos):
+            score = game.cached_evaluate(pos, player)
+        else:
+            score = tablebase_score(tablebases, pos)
+            if score is not None:
+                score = -score
+        value = (score, game.cached_evaluate(pos, player)) if score is not None else None
+        pos.unmake_move()
+        if value is None:
+            return None
+        if best is None or value > best:
+            best_move, best = move, value
+    return best_move
+
+def snapshot_tag(player):
+    """
+    Tag of transposition table snapshots (see TranspositionTable.save) for a game played as player: the search
+    values are from the root player's point of view and depend on the evaluation, so a snapshot is only loaded into
+    a game with the same colour and weights
+    """
+    settings = [player, get_weights(), stalemate_threshold]
+    return zlib.crc32(json.dumps(settings, sort_keys=True).encode())
+
+def book_key(state):
+    """
+    canonical_key of a book position. Book positions are all in the placement phase, so only the symmetries that
+    keep its evaluation count (see placement_symmetries), and the book move was searched with the evaluation
+    the real position gets
+    """
+    return canonical_key(state, PLACEMENT_SYMMETRIES)
+
+def book_move(book, state, game):
+    """The opening book's move for state in this orientation, or None if the book doesn't have the position"""
+    key, i = book_key(state)
+    move = book.lookup(key)
+    if move is None:
+        return None
+    move = transform_move(move, INVERSE_SYMMETRIES[i])
+    return move if move in game.actions(state) else None
+
+# Set in every Lazy SMP helper process when the pool starts
+_helper_game = None
+_helper_tt = None
+_helper_stop = None
+
+def _init_helper(tt, stop_event):
+    global _helper_game, _helper_tt, _helper_stop
+    _helper_game = Lasker_Morris()
+    _helper_tt = tt
+    _helper_stop = stop_event
+
+def _helper_search(state, index, max_depth):
+    """Search state in a helper process until the main search is done, returns the number of nodes searched"""
+    timer = TimeManager(math.inf, 0, stop_event=_helper_stop)
+    # Odd helpers start a depth ahead so the helpers spread over two depths instead of racing through the same one
+    alpha_beta_deepening_search(state, _helper_game, max_depth, timer, _helper_tt, first_depth=1 + index % 2)
+    return timer.nodes
+
+class LazySMP():
+    """
+    Parallel search: threads - 1 helper processes search the same position as the main search,
+    all into one transposition table in shared memory. The helpers' results are never used directly,
+    they only fill the table with entries that let the main search cut off sooner.
+    The helpers are forked once when the object is made and stopped as soon as the main search returns.
+    Use smp_search() to get a plain single process search when forking isn't available
+    """
+    def __init__(self, threads, size_mb=None):
+        self.threads = threads
+        # Kept for the whole game, ours is the only root player
+        self.tt = SharedTranspositionTable(size_mb if size_mb is not None else tt_size_mb)
+        self.stop_event = multiprocessing.get_context('fork').Event()
+        self.pool = multiprocessing.get_context('fork').Pool(threads - 1, initializer=_init_helper,
+                                                             initargs=(self.tt, self.stop_event))
+        self.nodes = 0 # Nodes searched by all processes in the last search
+
+    def search(self, state, game, max_depth=None, timer=None, tt=None, stats=None):
+        """
+        Same arguments as alpha_beta_deepening_search, except that the shared table is always used.
+        stats only counts the main search, the helpers' nodes are added to self.nodes
+        """
+        if timer is None:
+            timer = TimeManager(time_limit, safe_margin)
+        self.stop_event.clear()
+        helpers = [self.pool.apply_async(_helper_search, (state, i, max_depth)) for i in range(self.threads - 1)]
+        try:
+            best = alpha_beta_deepening_search(state, game, max_depth, timer, self.tt, stats=stats)
+        finally:
+            self.stop_event.set()
+            self.nodes = timer.nodes + sum(helper.get() for helper in helpers)
+        return best
+
+    def close(self):
+        self.stop_event.set()
+        self.pool.terminate()
+
+def smp_search(threads, size_mb=None):
+    """A LazySMP searcher for threads > 1 if this platform can fork, otherwise None (search in this process only)"""
+    if threads <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return LazySMP(threads, size_mb)
+
+class Ponderer():
+    """
+    Thinks on the opponent's time. After our move it guesses the opponent's reply from the transposition table
+    and searches the position after that reply in a background thread while main() waits for input.
+    If the guess was right the search carries on, now against the normal budget for a move.
+    If not it is stopped, and the real position is searched with the table it warmed up
+    """
+    def __init__(self, game, timer, search=alpha_beta_deepening_search, tt=None):
+        self.game = game
+        self.timer = timer # Budget for moves searched from scratch
+        self.ponder_timer = TimeManager(timer.time_limit, timer.safe_margin)
+        self.search_function = search
+        # Shared by every search, ours and the ponder ones
+        self.tt = tt if tt is not None else TranspositionTable(tt_size_mb)
+        self.thread = None
+        self.state = None # Position the ponder search is running on
+        self.move = None # Best move the ponder search found
+        self.stats = None # Counters of the ponder search
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, state, stats=None):
+        """
+        Our move has been played and the opponent is to move in state, start pondering on their likely reply.
+        stats (a SearchStats) counts the ponder search
+        """
+        if self.game.terminal_test(state):
+            return
+        key, sym = search_key(state)
+        entry = self.tt.probe(key)
+        if entry is None or not entry[3]:
+            return
+        predicted = self.game.result(state, from_table(entry[3], sym))
+        if predicted == "INVALID" or self.game.terminal_test(predicted):
+            return
+        self.state = predicted
+        self.move = None
+        self.stats = stats
+        self.ponder_timer.ponder()
+        self.thread = threading.Thread(target=self.run, args=(predicted,), daemon=True)
+        self.thread.start()
+
+    def run(self, state):
+        self.move = self.search_function(state, self.game, MAX_PLY, self.ponder_timer, self.tt, stats=self.stats)
+
+    def stop(self):
+        """Abandon the ponder search, if there is one"""
+        if self.thread is not None:
+            self.ponder_timer.stop()
+            self.thread.join()
+            self.thread = None
+
+    def search(self, state, stats=None):
+        """
+        Best move in state, which is the position after the opponent's actual reply.
+        After a ponder hit the ponder search's counters are added to stats
+        """
+        if self.thread is not None:
+            hit = state == self.state
+            if hit:
+                self.hits += 1
+                self.ponder_timer.ponderhit()
+            else:
+                self.misses += 1
+                self.ponder_timer.stop()
+            self.thread.join()
+            self.thread = None
+            if hit and self.move is not None:
+                if stats is not None and self.stats is not None:
+                    stats.add(self.stats)
+                return self.move
+        return self.search_function(state, self.game, timer=self.timer, tt=self.tt, stats=stats)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Lasker Morris player, talks to the referee over stdin/stdout")
+    parser.add_argument('--time-limit', type=float, default=time_limit, help="seconds allowed per move")
+    parser.add_argument('--safe-margin', type=float, default=safe_margin,
+                        help="seconds kept in reserve to send the move before the limit")
+    parser.add_argument('--ponder', action='store_true', help="keep searching while the opponent thinks")
+    parser.add_argument('--hash-mb', type=float, default=tt_size_mb,
+                        help="memory budget of the transposition table in MB")
+    parser.add_argument('--eval-cache-mb', type=float, default=eval_cache_mb,
+                        help="memory budget of the static evaluation cache in MB")
+    parser.add_argument('--quiescence-depth', type=int, default=quiescence_depth,
+                        help="plies of captures and mill blocks searched past the horizon, 0 for none")
+    parser.add_argument('--no-lmr', action='store_true', help="turn off late move reductions")
+    parser.add_argument('--no-futility', action='store_true', help="turn off futility pruning")
+    parser.add_argument('--no-razoring', action='store_true', help="turn off razoring")
+    parser.add_argument('--no-symmetry', action='store_true',
+                        help="don't share table entries between positions that are symmetries of each other")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="processes to search with (Lazy SMP), 1 searches in this process only")
+    parser.add_argument('--book', default=opening_book, help="opening book file, skipped if it doesn't exist")
+    parser.add_argument('--tablebases', default=tablebase_dir,
+                        help="directory of endgame tablebases, skipped if it doesn't exist")
+    parser.add_argument('--weights', metavar='FILE', help="evaluation weights to use, as written by tuning.py")
+    parser.add_argument('--tt-snapshot', metavar='FILE',
+                        help="start from the transposition table the last game left in FILE and save it there after "
+                             "every move (one file per colour, FILE.blue and FILE.orange)")
+    parser.add_argument('--stats', metavar='FILE', nargs='?', const='-',
+                        help="write the search counters of every move as JSON lines to FILE, or to stderr without one")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="profile every move decision, writing .pstats files and collapsed stacks to DIR")
+    parser.add_argument('--profile-threshold', type=float, default=0, metavar='SECONDS',
+                        help="with --profile, only keep the profiles of moves that took at least this long")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global quiescence_depth, use_lmr, use_futility, use_razoring, use_symmetry, tt_size_mb, eval_cache_mb
+    args = parse_args(argv)
+    tt_size_mb = args.hash_mb
+    if args.eval_cache_mb != eval_cache_mb:
+        eval_cache_mb = args.eval_cache_mb
+        Lasker_Morris.eval_cache = EvalCache(eval_cache_mb)
+    quiescence_depth = args.quiescence_depth
+    use_lmr = use_lmr and not args.no_lmr
+    use_futility = use_futility and not args.no_futility
+    use_razoring = use_razoring and not args.no_razoring
+    use_symmetry = use_symmetry and not args.no_symmetry
+    timer = TimeManager(args.time_limit, args.safe_margin)
+    if args.weights:
+        load_weights(args.weights)
+    if os.path.isdir(args.tablebases):
+        Lasker_Morris.tablebases = Tablebases(args.tablebases)
 
-def main():
     # Read initial color/symbol
     player_id = input().strip()
     first_move_made = 0
     LM = Lasker_Morris()
     theState = LM.initial  # gamestate
+    smp = smp_search(args.threads, tt_size_mb)
+    search = smp.search if smp is not None else alpha_beta_deepening_search
+    # One table for the whole game, each search starts a new generation of it. Whatever the last search found
+    # about the position we are in now (the rest of its principal variation, the replies it looked at) is kept
+    tt = smp.tt if smp is not None else TranspositionTable(tt_size_mb)
+    ponderer = None
+    if args.ponder:
+        ponderer = Ponderer(LM, timer, search, tt)
+
+    snapshot = f"{args.tt_snapshot}.{player_id}" if args.tt_snapshot else None
+    tag = snapshot_tag(player_id)
+    if snapshot is not None and os.path.exists(snapshot):
+        tt.load(snapshot, tag)
+    saving = None # Thread writing the last snapshot out
+
+    book = OpeningBook(args.book) if os.path.exists(args.book) else None
+    # Search counters go to stderr or a file, never stdout where the referee reads our moves
+    stats_log = None
+    if args.stats is not None:
+        stats_log = sys.stderr if args.stats == '-' else open(args.stats, 'a')
+
+    move_numbers = itertools.count(1)
+    profiler = None
+    if args.profile:
+        profiler = MoveProfiler(args.profile, args.profile_threshold)
+        # after_move() writes the profiles out, this is for the last move, after which the game is over
+        atexit.register(profiler.flush)
+
+    def new_stats():
+        return SearchStats(counters=True) if stats_log is not None else None
+
+    def log_stats(state, move, move_number, source, stats, start):
+        record = {'move_number': move_number, 'player': state.to_move,
+                  'move': format_move(move, state.to_move), 'source': source, 'seconds': round(time() - start, 4)}
+        if stats is not None:
+            record.update(stats.as_dict())
+        stats_log.write(json.dumps(record) + '\n')
+        stats_log.flush()
+
+    def choose(state, move_number):
+        start = time()
+        if book is not None:
+            move = book_move(book, state, LM)
+            if move is not None:
+                if ponderer is not None:
+                    ponderer.stop()
+                if stats_log is not None:
+                    log_stats(state, move, move_number, 'book', None, start)
+                return move
+        stats = new_stats()
+        if ponderer is not None:
+            move = ponderer.search(state, stats)
+        else:
+            move = search(state, LM, timer=timer, tt=tt, stats=stats)
+        if stats_log is not None:
+            log_stats(state, move, move_number, 'search', stats, start)
+        return move
+
+    def think(state):
+        move_number = next(move_numbers)
+        # When pondering the generation was started before the ponder search, which may still be searching
+        # into the table now that it is a real search
+        if ponderer is None:
+            tt.new_search()
+        if profiler is not None:
+            return profiler.run(choose, state, move_number, move_number=move_number, player=state.to_move,
+                                position=format_position(state))
+        return choose(state, move_number)
+
+    def after_move(state):
+        nonlocal saving
+        if profiler is not None:
+            profiler.flush()
+        # The referee may end the process as soon as the game is over, so the snapshot is saved after every move
+        # we send. It is written out in the background, if the last one still is this move's is skipped
+        if snapshot is not None and (saving is None or not saving.is_alive()):
+            saving = tt.save(snapshot, tag, background=True)
+        if ponderer is not None:
+            tt.new_search()
+            ponderer.start(state, new_stats())
 
     while True:
         # first move logic
         if player_id == "blue" and first_move_made == 0:
-            moveX1 = alpha_beta_deepening_search(theState, LM)  # get best 1st move as X
+            moveX1 = think(theState)  # get best 1st move as X
             # update internal board with our move
             theState = LM.result(theState, moveX1)
             first_move_made += 1
-            print(moveX1, flush=True)  # send move to referee
+            print(format_move(moveX1, player_id), flush=True)  # send move to referee
+            after_move(theState)
 
         try:
             if player_id == "orange":
                 # Read opponent's move
                 opponent_inputX = input().strip()  # opponent move as X/blue
                 # update internal board with opponent move
-                theState = LM.result(theState, opponent_inputX)
+                theState = LM.result(theState, parse_move(opponent_inputX))
                 if theState == "INVALID":
                     print("blue player has played an invalid move; orange player wins!", flush=True)
                     sys.exit(0)
-                moveO1 = alpha_beta_deepening_search(theState, LM)  # get best move as O
+                moveO1 = think(theState)  # get best move as O
                 theState = LM.result(theState, moveO1)
-                print(moveO1, flush=True)
+                print(format_move(moveO1, player_id), flush=True)
                 # check for orange win and terminate if win is found
                 if LM.terminal_test(theState) and theState.utility == 100:
                     print("GAME OVER: orange player wins!")
                     sys.exit(0)
+                after_move(theState)
 
             # Read opponent's move
             opponent_inputO = input().strip()  # opponent move as O
             # update internal board with opponent move
-            theState = LM.result(theState, opponent_inputO)
+            theState = LM.result(theState, parse_move(opponent_inputO))
             if theState == "INVALID":
                 print("orange player has played an invalid move; blue player wins!", flush=True)
                 sys.exit(0)
             # Move logic
-            moveX2 = alpha_beta_deepening_search(theState, LM)  # get best move as X
+            moveX2 = think(theState)  # get best move as X
             theState = LM.result(theState, moveX2)
             # Send move to referee
-            print(moveX2, flush=True)
+            print(format_move(moveX2, player_id), flush=True)
             # check for blue win and terminate if win is found
             if LM.terminal_test(theState) and theState.utility == 100:
                 print("GAME OVER: blue player wins!")
@@ -619,6 +1719,7 @@ def main():
             if LM.terminal_test(theState) and theState.utility == 0:
                 print("GAME OVER: it's a draw!")
                 sys.exit(0)
+            after_move(theState)
         except Exception as e:
             print("Error:", e)
             sys.exit(1)
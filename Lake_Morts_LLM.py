@@ -1,6 +1,7 @@
 import math
 import sys
 from collections import namedtuple
+from functools import cached_property
 from time import time, sleep
 import os
 from dotenv import load_dotenv
@@ -40,7 +41,19 @@ def extract_move(response_text):
         return None
 
 #Code from Textbook with some minor modifications
-GameState = namedtuple('GameState', 'to_move, utility, board, moves, removed, stalemate_count')
+# moves and utility are only worked out the first time something asks for them
+class GameState(namedtuple('GameState', 'to_move, board, removed, stalemate_count')):
+
+    @cached_property
+    def moves(self):
+        """Legal moves for the player to move"""
+        return _rules.actions(self)
+
+    @cached_property
+    def utility(self):
+        """Value of the state to the player to move"""
+        return _rules.utility(self, self.to_move)
+
 time_limit = 60  # seconds
 stalemate_threshold = 20
 safe_margin = 12  # 10 second safe margin
@@ -79,13 +92,9 @@ class Lasker_Morris():
         board = {pos: None for pos in self.positions}
 
         # All positions are initially available for placement by both players- only from hand, and no mills
-        # This is in the form of 'h1/h2 a4 r0'
-        moves = [f"{x} {y} {z}" for x in ['h1'] 
-                 for y in self.positions 
-                 for z in ['r0']]
-        
+        # (the moves are in the form of 'h1/h2 a4 r0', see GameState.moves)
         removed = {'blue': 0, 'orange': 0}
-        self.initial = GameState(to_move='blue', utility=0, board=board, moves=moves, removed=removed, stalemate_count = 0)
+        self.initial = GameState(to_move='blue', board=board, removed=removed, stalemate_count = 0)
 
         # Precompute which mills each position is in
         self.mills_by_position = self.compute_mills_by_position()
@@ -295,19 +304,12 @@ class Lasker_Morris():
         # If a new mill is formed but no removal was specified, the move is invalid
         if any(mill not in oldMills for mill in newMills) and partC == "r0":
             return "INVALID"
-            
-        # Remove the move from the list of available moves
-        new_moves = [m for m in state.moves if m != move]
 
         # Switch to the other player
         next_player = opponent
 
-        # Create a new state with a utility of 0 then update it by using the utility function
-        new_state = GameState(to_move=next_player, utility=0, board=new_board, moves=new_moves, removed=new_removed, stalemate_count=new_stalemate_count)
-        new_state = new_state._replace(moves=self.actions(new_state))
-        newest_state = new_state._replace(utility=self.utility(new_state, new_state.to_move))
-
-        return newest_state
+        # Create the new state, its moves and utility are only worked out if someone asks for them
+        return GameState(to_move=next_player, board=new_board, removed=new_removed, stalemate_count=new_stalemate_count)
 
     def utility(self, state, player):
         opponent = 'blue' if player == 'orange' else 'orange'
@@ -354,9 +356,11 @@ class Lasker_Morris():
     def __repr__(self):
         return '<{}>'.format(self.__class__.__name__)
 
+# Rules object behind the lazy GameState.moves and GameState.utility
+_rules = Lasker_Morris()
 
 def makePrompt(state):
-    # ('GameState', 'to_move, utility, board, moves, removed, stalemate_count')
+    # ('GameState', 'to_move, board, removed, stalemate_count') plus the lazy moves and utility
     player = state.to_move
     board = state.board
     boardStones = sum(1 for pos, val in state.board.items() if val == player)
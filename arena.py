@@ -0,0 +1,259 @@
+"""
+Engine against engine matches, played in-process with the Lasker_Morris rules over a pool of worker processes.
+
+Each side is a set of engine parameters, given as comma separated key=value pairs:
+    time=0.1        seconds per move (the default)
+    depth=4         search to a fixed depth instead, the clock is ignored
+    nodes=20000     stop every search after this many nodes
+    weights=w.json  evaluation weights, in the format of Lake_Morts.get_weights (keys left out keep their value)
+    lmr=0 futility=0 razoring=0 quiescence=2    the search switches of Lake_Morts
+Every opening is played twice, with the colours swapped. The score, the Elo difference of A over B with a 95% error
+margin and, with --sprt, the log likelihood ratio of the test are printed after every game.
+With a fixed depth or node budget the results don't depend on how busy the machine is, so those are the
+ones to use for long runs with many workers.
+
+    python arena.py --a depth=4 --b depth=4,lmr=0 --openings 100 --workers 8
+    python arena.py --a nodes=20000,weights=tuned.json --b nodes=20000 --sprt 0 10 --games 4000
+"""
+import argparse
+import copy
+import json
+import math
+import multiprocessing
+import random
+
+import Lake_Morts
+from Lake_Morts import (Lasker_Morris, alpha_beta_deepening_search, eval_cache_mb, format_move, get_weights,
+                        set_weights, tt_size_mb)
+from perft import START, parse_position
+from timeman import TimeManager
+from transposition import EvalCache, TranspositionTable
+
+MAX_PLIES = 400  # A game that runs this long is called a draw
+OPENING_PLIES = 4  # Length of the random openings
+
+# Engine parameters and how to read them, see the top of the file
+SIDE_PARAMETERS = {'time': float, 'depth': int, 'nodes': int, 'weights': str,
+                   'lmr': int, 'futility': int, 'razoring': int, 'quiescence': int}
+
+def parse_side(text):
+    """Turn 'depth=4,lmr=0' into {'depth': 4, 'lmr': 0}, raises ValueError for unknown keys"""
+    params = {}
+    for item in filter(None, text.split(',')):
+        key, _, value = item.partition('=')
+        if key not in SIDE_PARAMETERS:
+            raise ValueError(f"unknown engine parameter {key!r}, expected one of {', '.join(SIDE_PARAMETERS)}")
+        params[key] = SIDE_PARAMETERS[key](value)
+    return params
+
+class Engine():
+    """
+    One side of the match. The search reads its settings from Lake_Morts module globals, so before each of its
+    moves an engine puts its own settings, weights and evaluation cache in place.
+    Like Lake_Morts.main() it keeps one transposition table for the whole game
+    """
+    def __init__(self, params, default_weights):
+        self.time = params.get('time', 0.1)
+        self.depth = params.get('depth')
+        self.nodes = params.get('nodes', math.inf)
+        self.weights = copy.deepcopy(default_weights)
+        if 'weights' in params:
+            with open(params['weights']) as f:
+                loaded = json.load(f)
+            self.weights['phase'].update(loaded.get('phase', {}))
+            self.weights['position'].update(loaded.get('position', {}))
+            self.weights['positional'] = loaded.get('positional', self.weights['positional'])
+        self.globals = {
+            'use_lmr': bool(params.get('lmr', Lake_Morts.use_lmr)),
+            'use_futility': bool(params.get('futility', Lake_Morts.use_futility)),
+            'use_razoring': bool(params.get('razoring', Lake_Morts.use_razoring)),
+            'quiescence_depth': params.get('quiescence', Lake_Morts.quiescence_depth),
+        }
+        # Each side keeps its own cache, its evaluations are only valid with its own weights
+        self.eval_cache = EvalCache(eval_cache_mb)
+        # Made once, allocating it would take a good part of a short move's time
+        self.tt = TranspositionTable(tt_size_mb)
+
+    def new_game(self):
+        # The table's values are from the point of view of the side it played, which changes between games
+        self.tt.clear()
+
+    def move(self, game, state):
+        for name, value in self.globals.items():
+            setattr(Lake_Morts, name, value)
+        set_weights(self.weights)
+        Lasker_Morris.eval_cache = self.eval_cache
+        timer = TimeManager(self.time if self.depth is None else math.inf, 0, node_limit=self.nodes)
+        self.tt.new_search()
+        return alpha_beta_deepening_search(state, game, self.depth, timer, self.tt)
+
+_game = None
+_engines = None
+
+def _init_worker(a_params, b_params):
+    global _game, _engines
+    _game = Lasker_Morris()
+    default_weights = get_weights()
+    _engines = (Engine(a_params, default_weights), Engine(b_params, default_weights))
+
+def play_game(job):
+    """Play one game in a worker, job is (game number, opening position string, whether A plays blue)"""
+    number, opening, a_is_blue = job
+    state = parse_position(opening)
+    for engine in _engines:
+        engine.new_game()
+    moves = []
+    while len(moves) < MAX_PLIES and not _game.terminal_test(state):
+        engine = _engines[0] if (state.to_move == 'blue') == a_is_blue else _engines[1]
+        move = engine.move(_game, state)
+        if move is None:
+            break
+        moves.append(format_move(move, state.to_move))
+        state = _game.result(state, move)
+    if _game.terminal_test(state):
+        value = _game.evaluate(state, 'blue')
+        blue_score = 1 if value > 0 else 0 if value < 0 else 0.5
+    else:
+        blue_score = 0.5
+    return {'game': number, 'opening': opening, 'a_color': 'blue' if a_is_blue else 'orange',
+            'score': blue_score if a_is_blue else 1 - blue_score, 'plies': len(moves), 'moves': moves}
+
+def random_openings(game, count, seed, plies=OPENING_PLIES):
+    """count different positions reached by plies random moves from the start"""
+    rnd = random.Random(seed)
+    openings = []
+    seen = set()
+    for _ in range(count * 100):
+        if len(openings) == count:
+            break
+        state = parse_position(START)
+        for _ in range(plies):
+            state = game.result(state, rnd.choice(game.actions(state)))
+        if state.key not in seen and not game.terminal_test(state):
+            seen.add(state.key)
+            openings.append(Lake_Morts.format_position(state))
+    return openings
+
+def read_openings(path):
+    """Position strings from a file, one per line, '#' starts a comment"""
+    with open(path) as f:
+        lines = [line.split('#')[0].strip() for line in f]
+    openings = [line for line in lines if line]
+    for opening in openings:
+        parse_position(opening)
+    return openings
+
+def elo(score):
+    """Elo difference that gives an expected score (between 0 and 1)"""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+def expected_score(elo_difference):
+    return 1 / (1 + 10 ** (-elo_difference / 400))
+
+class MatchStats():
+    """Wins, draws and losses of A, with the Elo estimate and the sequential probability ratio test"""
+    def __init__(self, sprt=None, alpha=0.05, beta=0.05):
+        self.wins = self.draws = self.losses = 0
+        self.sprt = sprt # (elo0, elo1): H0 is that A is elo0 stronger, H1 that it's elo1 stronger
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def score(self):
+        return (self.wins + 0.5 * self.draws) / self.games
+
+    def variance(self):
+        """Variance of the result of one game"""
+        s = self.score()
+        return (self.wins * (1 - s) ** 2 + self.draws * (0.5 - s) ** 2 + self.losses * s ** 2) / self.games
+
+    def elo_interval(self):
+        """Elo estimate and the half width of its 95% confidence interval"""
+        s = self.score()
+        margin = 1.96 * math.sqrt(self.variance() / self.games)
+        low, high = elo(max(s - margin, 0)), elo(min(s + margin, 1))
+        return elo(s), (high - low) / 2
+
+    def llr(self):
+        """Log likelihood ratio of H1 against H0, in the normal approximation of the game results"""
+        variance = self.variance()
+        if not variance:
+            return 0.0
+        s0, s1 = expected_score(self.sprt[0]), expected_score(self.sprt[1])
+        return self.games * (s1 - s0) * (2 * self.score() - s0 - s1) / (2 * variance)
+
+    def decision(self):
+        """'H0' or 'H1' once the test has crossed one of its bounds, otherwise None"""
+        if self.sprt is None:
+            return None
+        llr = self.llr()
+        return 'H1' if llr >= self.upper else 'H0' if llr <= self.lower else None
+
+    def summary(self):
+        estimate, margin = self.elo_interval()
+        text = (f"{self.games} games: +{self.wins} ={self.draws} -{self.losses}, score {self.score():.3f}, "
+                f"elo {estimate:+.1f} +- {margin:.1f}")
+        if self.sprt is not None:
+            text += f", LLR {self.llr():.2f} [{self.lower:.2f}, {self.upper:.2f}]"
+        return text
+
+def main():
+    parser = argparse.ArgumentParser(description="Play engine A against engine B over a pool of processes")
+    parser.add_argument('--a', default='', help="engine parameters of A, like depth=4,lmr=0")
+    parser.add_argument('--b', default='', help="engine parameters of B")
+    parser.add_argument('--openings', type=int, default=50, help="number of random openings")
+    parser.add_argument('--opening-file', metavar='FILE', help="read the openings (position strings) from a file")
+    parser.add_argument('--seed', type=int, default=1, help="seed of the random openings")
+    parser.add_argument('--games', type=int, help="stop after this many games, cycling through the openings")
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--sprt', type=float, nargs=2, metavar=('ELO0', 'ELO1'),
+                        help="stop as soon as the test of elo0 against elo1 decides")
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--output', metavar='FILE', help="write every game as a JSON line")
+    args = parser.parse_args()
+
+    a_params, b_params = parse_side(args.a), parse_side(args.b)
+    game = Lasker_Morris()
+    openings = read_openings(args.opening_file) if args.opening_file else random_openings(game, args.openings, args.seed)
+    games = args.games if args.games is not None else 2 * len(openings)
+    jobs = [(i, openings[i // 2 % len(openings)], i % 2 == 0) for i in range(games)]
+
+    stats = MatchStats(tuple(args.sprt) if args.sprt else None, args.alpha, args.beta)
+    output = open(args.output, 'w') if args.output else None
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    pool = context.Pool(args.workers, initializer=_init_worker, initargs=(a_params, b_params))
+    try:
+        for result in pool.imap_unordered(play_game, jobs):
+            stats.add(result['score'])
+            if output is not None:
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+            print(stats.summary(), flush=True)
+            decision = stats.decision()
+            if decision is not None:
+                print(f"SPRT accepts {decision}: A is {args.sprt[decision == 'H1']:+g} Elo against B")
+                break
+    finally:
+        pool.terminate()
+        if output is not None:
+            output.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Lasker_Morris.utility for many positions at once, with numpy. Positions are given as arrays:
+    boards          (N, 24) int8, one column per square in POSITIONS order: 1 blue, -1 orange, 0 empty
+    hand            (N, 2) stones in hand of (blue, orange)
+    to_move         (N,) 0 when blue is to move, 1 when orange is
+    stalemate_count (N,) optional, 0 if left out
+The terms are counted with incidence matrices (mills x squares and squares x squares) instead of bit masks,
+following Lasker_Morris.evaluate and count_moves step by step, so the results are exactly the scalar ones.
+The stones removed so far don't enter the evaluation (the stones on the board are counted from the board),
+so they aren't needed.
+
+    python batch_eval.py --check 20000      compare with Lasker_Morris.utility on random positions
+"""
+import argparse
+import random
+from collections import namedtuple
+from time import time
+
+import numpy as np
+
+import Lake_Morts
+from Lake_Morts import (EVAL_SCALE, MILL_MASKS, MILLS_BY_SQUARE, PLAYERS, POSITIONS, STONES_PER_PLAYER, WIN_SCORE,
+                        GameState, Lasker_Morris, stalemate_threshold, zobrist_key)
+
+SQUARES = len(POSITIONS)
+# MILLS[m, sq] is 1 if square sq is in mill m, ADJACENT[a, b] is 1 if squares a and b are next to each other.
+# They are float32 so the products go through BLAS, every count is a small integer and comes out exact
+MILLS = np.array([[mill >> sq & 1 for sq in range(SQUARES)] for mill in MILL_MASKS], dtype=np.float32)
+ADJACENT = np.array([[mask >> sq & 1 for sq in range(SQUARES)] for mask in Lasker_Morris.ADJACENT_MASKS],
+                    dtype=np.float32)
+# The two mills through every square, as indices into MILLS
+SQUARE_MILLS = np.array([[MILL_MASKS.index(mill) for mill in mills] for mills in MILLS_BY_SQUARE])
+# Row 2 * sq + k marks the neighbours of sq that are in the k-th mill through sq
+ADJACENT_IN_MILL = (ADJACENT[:, None, :] * MILLS[SQUARE_MILLS]).reshape(2 * SQUARES, SQUARES)
+PHASES = ('placement', 'moving', 'flying')
+CHUNK = 4096  # positions evaluated in one go
+
+BatchEvaluation = namedtuple('BatchEvaluation', 'mills, potential_mills, pieces, mobility, score, utility')
+BatchEvaluation.__doc__ = """
+mills, potential_mills, pieces and mobility are (N, 2) arrays with a column for blue and one for orange
+(mobility is count_moves, the legal moves each player would have). score is evaluate() and utility is utility(),
+both for the player to move
+"""
+
+def count_mobility(own, opp, hand, removable_count, potential):
+    """count_moves of the player whose stones are own, for every position (own and opp are (N, 24) bool arrays)"""
+    board = own.sum(axis=1)
+    empty = ~(own | opp)
+    empty_count = empty.sum(axis=1)
+    own_float = own.astype(np.float32)
+    placing = hand > 0
+    sliding = (board > 0) & ((board != 3) | (hand == 0))
+    flying = board == 3
+
+    # Empty neighbours of every own stone
+    adjacent_moves = (own_float * (empty.astype(np.float32) @ ADJACENT)).sum(axis=1).astype(np.int64)
+    count = np.where(placing, empty_count, 0)
+    count += np.where(sliding, np.where(flying, board * empty_count, adjacent_moves), 0)
+
+    # Squares where a mill can be closed: the empty square of a potential mill, through either of its two mills
+    gap = potential[:, SQUARE_MILLS] & empty[:, :, None]  # (N, 24, 2)
+    first, second = gap[:, :, 0], gap[:, :, 1]
+    is_gap = first | second
+    # The stones that can close it are the own stones outside that mill: all of them if both mills are potential
+    # (they only share the empty square), all but the 2 in the mill if only one is
+    flying_closers = np.where(first & second, board[:, None], np.where(is_gap, board[:, None] - 2, 0))
+    adjacent_own = (own_float @ ADJACENT).astype(np.int64)
+    in_mill = (own_float @ ADJACENT_IN_MILL.T).astype(np.int64).reshape(-1, SQUARES, 2)
+    sliding_closers = np.where(first & second, adjacent_own,
+                               np.where(first, adjacent_own - in_mill[:, :, 0],
+                                        np.where(second, adjacent_own - in_mill[:, :, 1], 0)))
+    closing = np.where(placing, is_gap.sum(axis=1), 0)
+    closing += np.where(sliding, np.where(flying, flying_closers.sum(axis=1), sliding_closers.sum(axis=1)), 0)
+
+    count += (removable_count - 1) * closing
+    return np.where((hand == 0) & (board <= 2), 0, count)
+
+def evaluate_batch(boards, hand, to_move, stalemate_count=None):
+    """Mill, piece and mobility terms of every position and its evaluate()/utility() for the player to move"""
+    boards = np.asarray(boards)
+    hand = np.asarray(hand, dtype=np.int64)
+    to_move = np.asarray(to_move, dtype=np.int64)
+    n = len(boards)
+    count = np.zeros(n, dtype=np.int64) if stalemate_count is None else np.asarray(stalemate_count, dtype=np.int64)
+    # Big batches go through in chunks, so the temporary arrays stay in the cache
+    chunks = [evaluate_chunk(boards[i:i + CHUNK], hand[i:i + CHUNK], to_move[i:i + CHUNK], count[i:i + CHUNK])
+              for i in range(0, max(n, 1), CHUNK)]
+    if len(chunks) == 1:
+        return chunks[0]
+    return BatchEvaluation(*(np.concatenate(arrays) for arrays in zip(*chunks)))
+
+def evaluate_chunk(boards, hand, to_move, count):
+    n = len(boards)
+    rows = np.arange(n)
+    stones = (boards == 1, boards == -1)
+
+    in_mill = [(s.astype(np.float32) @ MILLS.T).astype(np.int8) for s in stones]  # (N, 16) stones per mill
+    complete = [in_mill[c] == 3 for c in (0, 1)]
+    potential = [(in_mill[c] == 2) & (in_mill[1 - c] == 0) for c in (0, 1)]
+    pieces = np.stack([s.sum(axis=1) for s in stones], axis=1)
+
+    # Lasker_Morris.removable: stones outside complete mills, or all of them if there are none
+    removable = []
+    for c in (0, 1):
+        milled = (complete[c].astype(np.float32) @ MILLS) > 0
+        free = (stones[c] & ~milled).sum(axis=1)
+        removable.append(np.where(free > 0, free, pieces[:, c]))
+    mobility = np.stack([count_mobility(stones[c], stones[1 - c], hand[:, c], removable[1 - c], potential[c])
+                         for c in (0, 1)], axis=1)
+    mills = np.stack([complete[c].sum(axis=1) for c in (0, 1)], axis=1)
+    potential_mills = np.stack([potential[c].sum(axis=1) for c in (0, 1)], axis=1)
+
+    # evaluate() from the point of view of the player to move
+    p, o = to_move, 1 - to_move
+    own_hand = hand[rows, p]
+    phase = np.where(own_hand > 0, 0, np.where(pieces[rows, p] == 3, 2, 1))
+    weights = np.array([Lake_Morts.SCALED_PHASE_WEIGHTS[name] for name in PHASES], dtype=np.int64)[phase]
+    values = np.array(Lake_Morts.POSITION_VALUES, dtype=np.int64)
+    positional = boards.astype(np.int64) @ values * np.where(p == 0, 1, -1)
+    score = (weights[:, 0] * (mills[rows, p] - mills[rows, o]) +
+             weights[:, 1] * (potential_mills[rows, p] - potential_mills[rows, o]) +
+             weights[:, 2] * (pieces[rows, p] - pieces[rows, o]) +
+             weights[:, 3] * (mobility[rows, p] - mobility[rows, o]) +
+             np.where(phase == 0, positional, 0))
+
+    # Finished games, checked in the same order as evaluate()
+    stalemate = count == stalemate_threshold
+    over = stalemate | (mobility[rows, p] == 0)
+    win = over & ((pieces[rows, o] < 3) | (mobility[rows, o] == 0))
+    loss = over & ~win & ((pieces[rows, p] < 3) | (mobility[rows, p] == 0))
+    draw = over & ~win & ~loss & stalemate
+    score = np.select([win, loss, draw], [WIN_SCORE, -WIN_SCORE, 0], score)
+    return BatchEvaluation(mills, potential_mills, pieces, mobility, score, score / EVAL_SCALE)
+
+def arrays_from_states(states):
+    """(boards, hand, to_move, stalemate_count) arrays of a list of GameStates"""
+    boards = np.zeros((len(states), SQUARES), dtype=np.int8)
+    for i, state in enumerate(states):
+        for sq in range(SQUARES):
+            boards[i, sq] = (state.pieces[0] >> sq & 1) - (state.pieces[1] >> sq & 1)
+    hand = np.array([state.hand for state in states], dtype=np.int64)
+    to_move = np.array([PLAYERS.index(state.to_move) for state in states], dtype=np.int64)
+    stalemate_count = np.array([state.stalemate_count for state in states], dtype=np.int64)
+    return boards, hand, to_move, stalemate_count
+
+def random_state(rnd):
+    """A random position: random stones on the board, random stones in hand, either side to move"""
+    squares = list(range(SQUARES))
+    rnd.shuffle(squares)
+    on_board = (rnd.randint(0, 9), rnd.randint(0, 9))
+    hand = tuple(rnd.randint(0, STONES_PER_PLAYER - on_board[c]) if rnd.random() < 0.5 else 0 for c in (0, 1))
+    blue = sum(1 << sq for sq in squares[:on_board[0]])
+    orange = sum(1 << sq for sq in squares[on_board[0]:on_board[0] + on_board[1]])
+    removed = tuple(STONES_PER_PLAYER - hand[c] - on_board[c] for c in (0, 1))
+    state = GameState(to_move=rnd.choice(PLAYERS), pieces=(blue, orange), hand=hand, on_board=on_board,
+                      removed=removed, stalemate_count=rnd.choice([0, 0, 5, stalemate_threshold]), key=0)
+    return state._replace(key=zobrist_key(state))
+
+def playout_states(game, rnd, count):
+    """Positions met along random games, which are closer to what the search sees than random_state"""
+    states = []
+    while len(states) < count:
+        state = game.initial
+        while not game.terminal_test(state) and len(states) < count:
+            states.append(state)
+            state = game.result(state, rnd.choice(game.actions(state)))
+        states.append(state)
+    return states[:count]
+
+def check(count, seed=1):
+    """Compare evaluate_batch with the scalar utility() on count random positions, returns the number that differ"""
+    game = Lasker_Morris()
+    rnd = random.Random(seed)
+    states = [random_state(rnd) for _ in range(count // 2)] + playout_states(game, rnd, count - count // 2)
+    start = time()
+    batch = evaluate_batch(*arrays_from_states(states))
+    elapsed = time() - start
+    start = time()
+    scalar = [game.evaluate(state, state.to_move) for state in states]
+    scalar_elapsed = time() - start
+    bad = 0
+    for i, state in enumerate(states):
+        p = PLAYERS.index(state.to_move)
+        expected = (game.count_moves(state, 0), game.count_moves(state, 1))
+        if (batch.score[i] != scalar[i] or batch.utility[i] != game.utility(state, state.to_move)
+                or tuple(batch.mobility[i]) != expected or batch.pieces[i, p] != state.on_board[p]):
+            bad += 1
+            if bad <= 5:
+                print(f"mismatch: {Lake_Morts.format_position(state)}: batch {batch.score[i]} "
+                      f"{tuple(batch.mobility[i])}, scalar {scalar[i]} {expected}")
+    print(f"{count} positions, {bad} mismatches, batch {elapsed:.3f}s, scalar evaluate {scalar_elapsed:.3f}s")
+    return bad
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the batch evaluation against the scalar one")
+    parser.add_argument('--check', type=int, default=10000, metavar='N', help="number of random positions")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if check(args.check, args.seed):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
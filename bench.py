@@ -0,0 +1,160 @@
+"""
+Search benchmark: runs alpha_beta_deepening_search over a fixed set of positions, once to a fixed depth and once
+with a fixed node budget, and reports nodes, nodes/sec, time to depth, effective branching factor and best move.
+
+The results can be written to JSON and compared with a stored baseline (bench_baseline.json). The run fails
+(exit 1) if nodes/sec or time to depth got worse than the baseline by more than --threshold, or if the fixed depth
+searches need more nodes than that. Node counts and best moves don't depend on the machine, nodes/sec and times
+do, so the baseline has to be saved again on a different machine.
+
+    python bench.py                                 run and print the table
+    python bench.py --output results.json --baseline bench_baseline.json
+    python bench.py --save-baseline bench_baseline.json
+    python bench.py --hit-rates --no-symmetry       how often the table and the evaluation cache hit, without symmetry
+"""
+import argparse
+import json
+import math
+import sys
+from time import time
+
+import Lake_Morts
+from Lake_Morts import Lasker_Morris, SearchStats, alpha_beta_deepening_search, format_move
+from perft import START, parse_position
+from timeman import TimeManager
+
+# (name, position string as in perft.py, fixed depth, node budget)
+POSITIONS = [
+    ('opening', START, 7, 100000),
+    ('placement', 'BO./.B./O.O/B..O../.B./..O/B.. b 5 5 0', 7, 100000),
+    ('late placement', 'BOB/.BO/O.O/B.OO.B/BB./O.O/B.. o 1 1 0', 7, 100000),
+    ('moving', 'B.B/OB./O.O/..BO.B/.O./B.O/..B o 0 0 3', 9, 100000),
+    ('moving, open', 'B.O/.B./O.B/.O..B./O.O/.B./B.. b 0 0 0', 8, 100000),
+    ('flying', 'B../.../O.O/.B..../.O./.../.B. b 0 0 0', 6, 100000),
+    ('flying against moving', 'BB./O../OO./B...../.../..O/... o 0 0 7', 6, 100000),
+]
+
+def search(game, state, depth=None, node_limit=math.inf):
+    """One search from a cold cache, returns its results as a dict"""
+    Lasker_Morris.eval_cache.clear()
+    timer = TimeManager(math.inf, 0, node_limit=node_limit)
+    start = time()
+    move = alpha_beta_deepening_search(state, game, depth, timer)
+    elapsed = time() - start
+    iterations = timer.iteration_nodes
+    # Effective branching factor: how many times more nodes the last finished iteration took than the one before
+    ebf = iterations[-1] / iterations[-2] if len(iterations) >= 2 and iterations[-2] else None
+    return {
+        'depth': len(iterations),
+        'nodes': timer.nodes,
+        'seconds': round(elapsed, 4),
+        'nps': round(timer.nodes / max(elapsed, 1e-9)),
+        'time_to_depth': [round(sum(timer.iteration_times[:i + 1]), 4) for i in range(len(iterations))],
+        'ebf': round(ebf, 2) if ebf is not None else None,
+        'best_move': format_move(move, state.to_move) if move is not None else None,
+    }
+
+def hit_rates(game, state, depth):
+    """
+    Transposition table and evaluation cache hit rates of a fixed depth search from a cold cache. The search runs
+    with the counters on, which slows it down, so it's kept apart from the timed searches
+    """
+    Lasker_Morris.eval_cache.clear()
+    stats = SearchStats(counters=True)
+    alpha_beta_deepening_search(state, game, depth, TimeManager(math.inf, 0), stats=stats)
+    return {
+        'nodes': stats.nodes,
+        'tt_hit_rate': round(stats.tt_hits / max(stats.tt_probes, 1), 4),
+        'eval_cache_hit_rate': round(stats.eval_cache_hits / max(stats.utility_calls, 1), 4),
+    }
+
+def hit_rate_report(game):
+    print(f"{'position':<22} {'depth':>5} {'nodes':>8} {'tt hits':>8} {'eval hits':>9}")
+    for name, text, depth, _ in POSITIONS:
+        r = hit_rates(game, parse_position(text), depth)
+        print(f"{name:<22} {depth:>5} {r['nodes']:>8} {r['tt_hit_rate']:>8.1%} {r['eval_cache_hit_rate']:>9.1%}")
+
+def run(game):
+    results = {}
+    for name, text, depth, node_limit in POSITIONS:
+        state = parse_position(text)
+        results[name] = {
+            'position': text,
+            'fixed_depth': search(game, state, depth=depth),
+            'node_budget': search(game, state, node_limit=node_limit),
+        }
+    fixed = [r['fixed_depth'] for r in results.values()]
+    budget = [r['node_budget'] for r in results.values()]
+    summary = {
+        'nodes': sum(r['nodes'] for r in fixed),
+        'time_to_depth': round(sum(r['seconds'] for r in fixed), 4),
+        'nps': round(sum(r['nodes'] for r in fixed + budget) / sum(r['seconds'] for r in fixed + budget)),
+    }
+    return {'positions': results, 'summary': summary}
+
+def report(results):
+    print(f"{'position':<22} {'depth':>5} {'nodes':>8} {'nps':>7} {'seconds':>8} {'ebf':>5} {'best':>10} | "
+          f"{'budget depth':>12} {'nps':>7} {'best':>10}")
+    for name, r in results['positions'].items():
+        fixed, budget = r['fixed_depth'], r['node_budget']
+        ebf = f"{fixed['ebf']:.2f}" if fixed['ebf'] is not None else '-'
+        print(f"{name:<22} {fixed['depth']:>5} {fixed['nodes']:>8} {fixed['nps']:>7} {fixed['seconds']:>8.2f} "
+              f"{ebf:>5} {fixed['best_move']:>10} | {budget['depth']:>12} {budget['nps']:>7} {budget['best_move']:>10}")
+    summary = results['summary']
+    print(f"total: {summary['nodes']} nodes to depth in {summary['time_to_depth']:.2f}s, {summary['nps']} nodes/sec")
+
+def compare(results, baseline, threshold):
+    """Print the changes against a baseline, returns False if one of them is a regression beyond threshold"""
+    ok = True
+    new, old = results['summary'], baseline['summary']
+    checks = [
+        ('nodes/sec', old['nps'], new['nps'], new['nps'] < old['nps'] * (1 - threshold)),
+        ('time to depth', old['time_to_depth'], new['time_to_depth'],
+         new['time_to_depth'] > old['time_to_depth'] * (1 + threshold)),
+        ('nodes to depth', old['nodes'], new['nodes'], new['nodes'] > old['nodes'] * (1 + threshold)),
+    ]
+    for label, before, after, regressed in checks:
+        change = (after - before) / before * 100 if before else 0
+        print(f"{label}: {before} -> {after} ({change:+.1f}%){'  REGRESSION' if regressed else ''}")
+        ok = ok and not regressed
+    for name, r in results['positions'].items():
+        old_position = baseline['positions'].get(name)
+        if old_position is None:
+            continue
+        before, after = old_position['fixed_depth'], r['fixed_depth']
+        if before['best_move'] != after['best_move'] or before['nodes'] != after['nodes']:
+            print(f"{name}: best move {before['best_move']} -> {after['best_move']}, "
+                  f"nodes {before['nodes']} -> {after['nodes']}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search on fixed positions")
+    parser.add_argument('--output', metavar='FILE', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='FILE', help="compare with a baseline, exit 1 on a regression")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="largest allowed slowdown against the baseline, as a fraction (default 0.2)")
+    parser.add_argument('--save-baseline', metavar='FILE', help="write the results as the new baseline")
+    parser.add_argument('--hit-rates', action='store_true',
+                        help="only print the table and evaluation cache hit rates of the fixed depth searches")
+    parser.add_argument('--no-symmetry', action='store_true',
+                        help="don't share table entries between positions that are symmetries of each other")
+    args = parser.parse_args()
+
+    Lake_Morts.use_symmetry = not args.no_symmetry
+    if args.hit_rates:
+        hit_rate_report(Lasker_Morris())
+        return
+    results = run(Lasker_Morris())
+    report(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
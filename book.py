@@ -0,0 +1,44 @@
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+
+# File layout: MAGIC, the number of entries, then every key (uint64, sorted) and then every move (uint16),
+# both in native byte order. Keys are exact canonical position keys from Lake_Morts.book_key and
+# moves are packed moves in the canonical orientation
+MAGIC = b'LMBOOK2\n'
+HEADER = struct.Struct('<8sQ')
+
+class OpeningBook():
+    """
+    Read-only opening book, memory mapped so opening it costs nothing and a lookup is a binary search
+    over the keys without loading the file
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or len(self.map) != HEADER.size + count * 10:
+            raise ValueError(f"{path} is not an opening book of this version, build it again with book_builder.py")
+        view = memoryview(self.map)
+        keys_end = HEADER.size + count * 8
+        self.keys = view[HEADER.size:keys_end].cast('Q')
+        self.moves = view[keys_end:].cast('H')
+
+    def lookup(self, key):
+        """The book move for a canonical key, or None if the position isn't in the book"""
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.moves[i]
+        return None
+
+    def __len__(self):
+        return len(self.keys)
+
+def write_book(path, entries):
+    """Write a {canonical key: move} dict as a book file"""
+    keys = sorted(entries)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(keys)))
+        array('Q', keys).tofile(f)
+        array('H', (entries[key] for key in keys)).tofile(f)
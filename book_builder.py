@@ -0,0 +1,63 @@
+"""
+Builds the opening book that Lake_Morts.py plays from during the placement phase.
+
+Every position we can face in the first --plies plies is searched to --depth. At our own turns only the book move
+is followed, the opponent's replies are all followed. Positions that are the same up to a board symmetry that
+keeps the placement phase evaluation (see Lake_Morts.book_key) are searched once, in their canonical orientation.
+
+    python book_builder.py --plies 4 --depth 6 --output opening_book.bin
+"""
+import argparse
+from time import time
+
+from Lake_Morts import (PLAYERS, SYMMETRIES, Lasker_Morris, alpha_beta_deepening_search, book_key, format_move,
+                        opening_book, transform_state)
+from book import OpeningBook, write_book
+
+def canonical_state(state):
+    key, i = book_key(state)
+    return key, transform_state(state, SYMMETRIES[i])
+
+def build(game, plies, depth, verbose=False):
+    """{canonical key: move} for every position either colour can reach in the first plies plies"""
+    entries = {}
+    for us in PLAYERS:
+        key, state = canonical_state(game.initial)
+        frontier = {key: state}
+        for ply in range(plies):
+            start = time()
+            following = {}
+            for key, state in frontier.items():
+                if game.terminal_test(state) or state.hand == (0, 0):
+                    continue
+                if state.to_move == us:
+                    if key not in entries:
+                        entries[key] = alpha_beta_deepening_search(state, game, max_depth=depth)
+                    moves = [entries[key]]
+                else:
+                    moves = game.actions(state)
+                for move in moves:
+                    child_key, child = canonical_state(game.result(state, move))
+                    following.setdefault(child_key, child)
+            if verbose:
+                print(f"{us} ply {ply}: {len(frontier)} positions, {time() - start:.1f}s, {len(entries)} book moves")
+            frontier = following
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the placement phase opening book")
+    parser.add_argument('--plies', type=int, default=4, help="cover our moves in the first this many plies")
+    parser.add_argument('--depth', type=int, default=6, help="search depth for every book position")
+    parser.add_argument('--output', default=opening_book)
+    args = parser.parse_args()
+
+    game = Lasker_Morris()
+    entries = build(game, args.plies, args.depth, verbose=True)
+    write_book(args.output, entries)
+
+    book = OpeningBook(args.output)
+    key, _ = book_key(game.initial)
+    print(f"wrote {len(book)} positions to {args.output}, first move {format_move(book.lookup(key), 'blue')}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+MAX_PLY = 64
+HISTORY_LIMIT = 1 << 20
+
+# Sort keys, anything below KILLER_SCORE is a history score
+PV_SCORE = 1 << 30
+TT_SCORE = 1 << 29
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORE = 1 << 27
+
+class MoveOrderer():
+    """
+    Decides the order moves are searched in, best guesses first:
+    the previous iteration's principal variation move, then the transposition table's best move,
+    then captures, then the killer moves of this ply, then quiet moves by their history score.
+    One orderer is kept for a whole iterative deepening search so later iterations learn from earlier ones
+    """
+    def __init__(self, capture_flag):
+        # capture_flag is the bit that marks a move as removing a stone
+        self.capture_flag = capture_flag
+        # Principal variation of the last finished iteration, one move per ply from the root
+        self.pv = []
+        # Two quiet moves per ply that recently caused a cutoff there
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        # Per side, how often each (source, target) pair caused a cutoff, weighted by depth
+        self.history = [[0] * 1024 for _ in range(2)]
+
+    def order(self, moves, ply, side, tt_move=0, pv_move=0):
+        """Return moves sorted best guess first for the given ply and side to move"""
+        capture_flag = self.capture_flag
+        history = self.history[side]
+        killer1, killer2 = self.killers[ply] if ply < MAX_PLY else (0, 0)
+
+        def score(move):
+            if move == pv_move:
+                return PV_SCORE
+            if move == tt_move:
+                return TT_SCORE
+            if move & capture_flag:
+                return CAPTURE_SCORE
+            if move == killer1:
+                return KILLER_SCORE + 1
+            if move == killer2:
+                return KILLER_SCORE
+            return history[move & 0x3FF]
+
+        return sorted(moves, key=score, reverse=True)
+
+    def cutoff(self, move, ply, depth, side):
+        """Remember a quiet move that caused a beta cutoff"""
+        if move & self.capture_flag:
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        history = self.history[side]
+        history[move & 0x3FF] += depth * depth
+        if history[move & 0x3FF] > HISTORY_LIMIT:
+            self.age()
+
+    def age(self):
+        """Halve the history scores so newer cutoffs count for more"""
+        for history in self.history:
+            for i, value in enumerate(history):
+                history[i] = value >> 1
@@ -0,0 +1,156 @@
+"""
+Counts the leaf nodes of the game tree to a fixed depth, to check and time Lasker_Morris.actions/result on their own.
+
+Positions are written like FEN: the squares column by column (a1 a4 a7 / b2 b4 b6 / ... / g1 g4 g7) with B for blue,
+O for orange and . for empty, then the side to move (b or o), the stones in hand of blue and orange and the
+stalemate counter:
+
+    BO./.../.../....../.../.../... b 7 8 3
+
+    python perft.py 4                         perft 1 to 4 from the start
+    python perft.py 3 --position "..." --divide
+    python perft.py --check perft_results.txt compare against the stored counts
+    python perft.py --write perft_results.txt store the counts of SUITE
+"""
+import argparse
+import sys
+from time import time
+
+from Lake_Morts import (COLUMN_SIZES, PLAYERS, STONES_PER_PLAYER, GameState, Lasker_Morris, Position, format_move,
+                        stalemate_threshold, zobrist_key)
+
+START = '/'.join('.' * size for size in COLUMN_SIZES) + ' b 10 10 0'
+
+# Positions of the canonical results file and the depth each one is counted to
+SUITE = [
+    (START, 4),
+    ('B../.O./..O/...B../.../.B./... b 7 8 4', 3),                 # placement, both sides one move from a mill
+    ('.BB/O.O/.../B.O.../..B/O../... o 4 4 0', 3),                 # placement, with mills and stones removed
+    ('B.B/OB./O.O/..BO.B/.O./B.O/..B o 0 0 3', 4),                 # moving
+    ('B../.../O.O/.B..../.O./.../.B. b 0 0 0', 3),                 # both sides flying
+    ('BB./O../OO./B...../.../..O/... o 0 0 7', 3),                 # flying against moving
+    ('B.B/OB./O.O/..BO.B/.O./B.O/..B b 0 0 18', 4),                # the stalemate counter runs out inside the tree
+]
+
+def parse_position(text):
+    """Turn a position string into a GameState, raises ValueError if it is malformed"""
+    try:
+        board, side, blue_hand, orange_hand, count = text.split()
+        hand = (int(blue_hand), int(orange_hand))
+        count = int(count)
+    except ValueError:
+        raise ValueError(f"bad position string: {text!r}")
+    columns = board.split('/')
+    if [len(column) for column in columns] != list(COLUMN_SIZES) or side not in ('b', 'o'):
+        raise ValueError(f"bad position string: {text!r}")
+    pieces = [0, 0]
+    for i, square in enumerate(''.join(columns)):
+        if square in 'BO':
+            pieces['BO'.index(square)] |= 1 << i
+        elif square != '.':
+            raise ValueError(f"bad square {square!r} in {text!r}")
+    on_board = (pieces[0].bit_count(), pieces[1].bit_count())
+    removed = tuple(STONES_PER_PLAYER - hand[p] - on_board[p] for p in range(2))
+    if min(removed) < 0:
+        raise ValueError(f"more than {STONES_PER_PLAYER} stones for one player in {text!r}")
+    state = GameState(to_move=PLAYERS[side == 'o'], pieces=tuple(pieces), hand=hand, on_board=on_board,
+                      removed=removed, stalemate_count=count, key=0)
+    return state._replace(key=zobrist_key(state))
+
+def perft(game, state, depth):
+    """Leaf nodes depth plies below state through actions/result, a finished game has no moves"""
+    if depth == 0:
+        return 1
+    if state.stalemate_count == stalemate_threshold:
+        return 0
+    moves = game.actions(state)
+    if depth == 1:
+        return len(moves)
+    return sum(perft(game, game.result(state, move), depth - 1) for move in moves)
+
+def perft_make_unmake(game, pos, depth):
+    """perft through Position.make_move/unmake_move, the path the search uses"""
+    if depth == 0:
+        return 1
+    if pos.stalemate_count == stalemate_threshold:
+        return 0
+    moves = game.actions(pos)
+    if depth == 1:
+        return len(moves)
+    total = 0
+    for move in moves:
+        pos.make_move(move)
+        total += perft_make_unmake(game, pos, depth - 1)
+        pos.unmake_move()
+    return total
+
+def count(game, state, depth, make_unmake=False):
+    if make_unmake:
+        return perft_make_unmake(game, Position(state), depth)
+    return perft(game, state, depth)
+
+def divide(game, state, depth, make_unmake=False):
+    """Print the perft subtotal below every move of state"""
+    total = 0
+    if state.stalemate_count != stalemate_threshold:
+        for move in game.actions(state):
+            nodes = count(game, game.result(state, move), depth - 1, make_unmake)
+            total += nodes
+            print(f"{format_move(move, state.to_move)}: {nodes}")
+    print(f"total: {total}")
+
+def check(game, path, make_unmake=False):
+    """Compare every line of a results file (position | depth | nodes) with a fresh count, True if all match"""
+    ok = True
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            text, depth, expected = (part.strip() for part in line.split('|'))
+            start = time()
+            nodes = count(game, parse_position(text), int(depth), make_unmake)
+            status = 'ok' if nodes == int(expected) else f'MISMATCH, expected {expected}'
+            ok = ok and nodes == int(expected)
+            print(f"{text} depth {depth}: {nodes} {status} ({time() - start:.2f}s)")
+    return ok
+
+def write(game, path):
+    with open(path, 'w') as f:
+        f.write("# Canonical perft counts of the reference rules: position | depth | leaf nodes\n")
+        for text, depth in SUITE:
+            f.write(f"{text} | {depth} | {perft(game, parse_position(text), depth)}\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft for the Lasker Morris move generator")
+    parser.add_argument('depth', type=int, nargs='?', default=3)
+    parser.add_argument('--position', default=START, help="position string, the start position by default")
+    parser.add_argument('--divide', action='store_true', help="show the count below every move")
+    parser.add_argument('--make-unmake', action='store_true', help="walk the tree with Position instead of result()")
+    parser.add_argument('--check', metavar='FILE', help="compare against a results file, exit 1 on a mismatch")
+    parser.add_argument('--write', metavar='FILE', help="write the counts of the built-in suite to a results file")
+    args = parser.parse_args()
+    if args.divide and args.depth < 1:
+        parser.error("--divide needs a depth of at least 1")
+    if args.depth < 0:
+        parser.error("depth can't be negative")
+
+    game = Lasker_Morris()
+    if args.check:
+        sys.exit(0 if check(game, args.check, args.make_unmake) else 1)
+    if args.write:
+        write(game, args.write)
+        return
+
+    state = parse_position(args.position)
+    if args.divide:
+        divide(game, state, args.depth, args.make_unmake)
+        return
+    for depth in range(1, args.depth + 1):
+        start = time()
+        nodes = count(game, state, depth, args.make_unmake)
+        elapsed = time() - start
+        print(f"perft {depth}: {nodes} nodes, {elapsed:.2f}s, {nodes / max(elapsed, 1e-9):.0f} nodes/sec")
+
+if __name__ == "__main__":
+    main()
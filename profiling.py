@@ -0,0 +1,93 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from time import time
+
+# Profiles of single move decisions, for Lake_Morts.py --profile.
+# Every profiled move gets two files in the output directory:
+#   move<N>_<player>.pstats  cProfile statistics, for pstats or snakeviz
+#   move<N>_<player>.folded  collapsed stacks from a sampling thread, one "outer;...;inner count" line per stack,
+#                            the input of flamegraph.pl and speedscope
+# and a line in index.jsonl with the move number, player, position and time taken
+SAMPLE_INTERVAL = 0.001  # seconds between stack samples
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class StackSampler():
+    """Samples the stack of one thread from a background thread and counts how often each stack was seen"""
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+class MoveProfiler():
+    """
+    Runs move decisions under cProfile and a stack sampler, and keeps the profiles of the ones that took
+    at least threshold seconds (all of them with threshold 0).
+    Only the calling thread is profiled, a ponder search running in the background isn't.
+    The profiles are only written by flush(), so writing them doesn't slow down the moves being measured
+    """
+    def __init__(self, directory, threshold=0):
+        self.directory = directory
+        self.threshold = threshold
+        self.pending = [] # Profiles kept and not written yet
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, function, *args, move_number=0, player='', position=''):
+        """Call function(*args) and return what it returns, profiling the call"""
+        profile = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident())
+        start = time()
+        sampler.start()
+        profile.enable()
+        try:
+            return function(*args)
+        finally:
+            profile.disable()
+            sampler.stop()
+            elapsed = time() - start
+            if elapsed >= self.threshold:
+                self.pending.append((profile, sampler, elapsed, move_number, player, position))
+
+    def flush(self):
+        """Write out the profiles kept since the last flush, once the move has been sent"""
+        while self.pending:
+            self.write(*self.pending.pop(0))
+
+    def write(self, profile, sampler, elapsed, move_number, player, position):
+        name = f"move{move_number:03d}_{player}"
+        profile.dump_stats(os.path.join(self.directory, name + '.pstats'))
+        sampler.write(os.path.join(self.directory, name + '.folded'))
+        record = {'move_number': move_number, 'player': player, 'position': position, 'seconds': round(elapsed, 4),
+                  'pstats': name + '.pstats', 'stacks': name + '.folded', 'samples': sum(sampler.stacks.values())}
+        with open(os.path.join(self.directory, 'index.jsonl'), 'a') as f:
+            f.write(json.dumps(record) + '\n')
@@ -0,0 +1,196 @@
+"""
+Local stand-in for the tournament referee: runs two player programs and talks to them over stdin/stdout with the
+same protocol, the colour first ("blue" or "orange"), then one move per line like "h1 a4 r0".
+Every move is checked with Lasker_Morris.result and timed on the wall clock from the moment the player had what it
+needed to move (for blue's first move that is the moment it was launched, so process startup counts), so the
+latencies include startup, pipes and flushing. A player that sends an invalid move, misses the deadline or dies
+loses the game.
+
+At the end it prints, for each player, how the moves spread over fractions of the time limit, the slowest moves,
+the timeouts and the first move after launch.
+
+    python referee.py --a "python Lake_Morts.py --time-limit 1" --b "python Lake_Morts_LLM.py" --time-limit 1
+    python referee.py --games 10 --output latencies.json
+"""
+import argparse
+import json
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+from time import time
+
+from Lake_Morts import HAND, Lasker_Morris, parse_move, time_limit
+
+# Upper edges of the latency histogram, as fractions of the time limit
+BUCKETS = (0.25, 0.5, 0.75, 0.9, 0.95, 1.0, float('inf'))
+HAND_NAMES = {'blue': 'h1', 'orange': 'h2'}
+
+class Player():
+    """A player program, with a thread that queues its output lines (None once it closes stdout)"""
+    def __init__(self, name, command, color):
+        self.name = name
+        self.color = color
+        self.launched = time()
+        self.process = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        self.lines = queue.Queue()
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        for line in self.process.stdout:
+            self.lines.put(line.strip())
+        self.lines.put(None)
+
+    def send(self, line):
+        self.process.stdin.write(line + '\n')
+        self.process.stdin.flush()
+
+    def receive(self, deadline):
+        """The next non-empty line, or None if the player closed its output or the deadline passed"""
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time(), 0))
+            except queue.Empty:
+                return None
+            if line != '':
+                return line
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+def valid_text(text, color):
+    """The referee's own check of the move text: hand moves must use the mover's own hand name"""
+    move = parse_move(text)
+    if move is None:
+        return None
+    if move & 31 == HAND and text.split()[0] != HAND_NAMES[color]:
+        return None
+    return move
+
+def play(game, commands, names, time_limit):
+    """
+    Play one game between two commands (blue's first), returns a dict with the winner ('blue', 'orange' or None),
+    the reason, the moves and every move's latency
+    """
+    players = {color: Player(name, command, color) for color, name, command in zip(('blue', 'orange'), names, commands)}
+    latencies = {color: [] for color in players}
+    moves = []
+    winner, reason = None, None
+    try:
+        for color, player in players.items():
+            player.send(color)
+        state = game.initial
+        given = players['blue'].launched  # When the player to move got what it needs to move
+        while not game.terminal_test(state):
+            color = state.to_move
+            other = 'orange' if color == 'blue' else 'blue'
+            line = players[color].receive(given + time_limit)
+            latency = time() - given
+            if line is None:
+                alive = players[color].process.poll() is None
+                winner, reason = other, f"{color} {'timed out' if alive else 'exited'} after {latency:.3f}s"
+                latencies[color].append(latency)
+                break
+            latencies[color].append(latency)
+            move = valid_text(line, color)
+            if move is None:
+                winner, reason = other, f"{color} played an invalid move: {line!r}"
+                break
+            # result() takes some moves that aren't legal (slides to squares that aren't adjacent, placements
+            # from an empty hand), so the move must be one of the legal ones
+            if move not in game.actions(state):
+                winner, reason = other, f"{color} played an illegal move: {line!r}"
+                break
+            moves.append(line)
+            state = game.result(state, move)
+            if game.terminal_test(state):
+                break
+            try:
+                players[other].send(line)
+            except (BrokenPipeError, OSError):
+                winner, reason = color, f"{other} exited"
+                break
+            given = time()
+        if reason is None:
+            value = game.evaluate(state, 'blue')
+            winner = 'blue' if value > 0 else 'orange' if value < 0 else None
+            reason = 'game over' if winner else 'draw'
+    finally:
+        for player in players.values():
+            player.close()
+    return {'winner': winner, 'reason': reason, 'players': {color: p.name for color, p in players.items()},
+            'moves': moves, 'latencies': latencies}
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def latency_report(name, latencies, first_moves, limit):
+    """Summary of one player's latencies: first moves after launch are kept apart from the rest"""
+    counts = [0] * len(BUCKETS)
+    for latency in latencies:
+        counts[next(i for i, edge in enumerate(BUCKETS) if latency <= edge * limit)] += 1
+    report = {'player': name, 'moves': len(latencies), 'timeouts': sum(latency > limit for latency in latencies),
+              'histogram': {f"<={edge:g}" if edge != float('inf') else '>1': count
+                            for edge, count in zip(BUCKETS, counts)}}
+    if latencies:
+        report.update({'mean': sum(latencies) / len(latencies), 'p50': percentile(latencies, 0.5),
+                       'p90': percentile(latencies, 0.9), 'p99': percentile(latencies, 0.99), 'max': max(latencies)})
+    if first_moves:
+        report['first_move_after_launch'] = {'mean': sum(first_moves) / len(first_moves), 'max': max(first_moves)}
+    return report
+
+def print_report(report, limit):
+    print(f"{report['player']}: {report['moves']} moves, {report['timeouts']} timeouts")
+    if report['moves']:
+        print(f"  latency mean {report['mean']:.3f}s  p50 {report['p50']:.3f}s  p90 {report['p90']:.3f}s  "
+              f"p99 {report['p99']:.3f}s  max {report['max']:.3f}s (limit {limit:g}s)")
+    total = max(report['moves'], 1)
+    for bucket, count in report['histogram'].items():
+        label = f"{bucket} of limit" if bucket != '>1' else "over limit"
+        print(f"  {label:>16} {count:6} {'#' * round(40 * count / total)}")
+    if 'first_move_after_launch' in report:
+        first = report['first_move_after_launch']
+        print(f"  first move as blue, from launch: mean {first['mean']:.3f}s max {first['max']:.3f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play two programs against each other over the referee protocol")
+    parser.add_argument('--a', default=f"{sys.executable} Lake_Morts.py", help="command of player A")
+    parser.add_argument('--b', default=f"{sys.executable} Lake_Morts.py", help="command of player B")
+    parser.add_argument('--time-limit', type=float, default=time_limit, help="seconds allowed per move")
+    parser.add_argument('--games', type=int, default=1, help="games to play, A is blue in the odd ones")
+    parser.add_argument('--output', metavar='FILE', help="write the games and the latency report as JSON")
+    args = parser.parse_args()
+
+    game = Lasker_Morris()
+    results = []
+    latencies = {'A': [], 'B': []}
+    first_moves = {'A': [], 'B': []}
+    for i in range(args.games):
+        names = ('A', 'B') if i % 2 == 0 else ('B', 'A')
+        commands = [args.a if name == 'A' else args.b for name in names]
+        result = play(game, commands, names, args.time_limit)
+        results.append(result)
+        for color, name in zip(('blue', 'orange'), names):
+            moves = result['latencies'][color]
+            if color == 'blue' and moves:
+                first_moves[name].append(moves[0])
+                moves = moves[1:]
+            latencies[name].extend(moves)
+        winner = result['players'][result['winner']] if result['winner'] else 'nobody'
+        print(f"game {i + 1}: A is {'blue' if names[0] == 'A' else 'orange'}, {len(result['moves'])} moves, "
+              f"{winner} wins ({result['reason']})", flush=True)
+
+    reports = [latency_report(name, latencies[name], first_moves[name], args.time_limit) for name in ('A', 'B')]
+    for report in reports:
+        print_report(report, args.time_limit)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'time_limit': args.time_limit, 'games': results, 'latency': reports}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
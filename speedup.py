@@ -0,0 +1,69 @@
+"""
+Measures how much the Lazy SMP search (--threads) helps: searches a few fixed positions to a fixed depth
+with one process and with N, and prints time to depth and nodes/sec for both.
+
+    python speedup.py --threads 8 --depth 6
+"""
+import argparse
+import math
+import random
+from time import time
+
+from Lake_Morts import Lasker_Morris, LazySMP, alpha_beta_deepening_search
+from timeman import TimeManager
+
+# Random playouts from the start, (seed, plies): two placement positions and two moving ones
+POSITIONS = [(1, 4), (2, 12), (1, 40), (3, 60)]
+
+def playout(game, seed, plies):
+    rnd = random.Random(seed)
+    state = game.initial
+    for _ in range(plies):
+        actions = game.actions(state)
+        if not actions or game.terminal_test(state):
+            break
+        state = game.result(state, rnd.choice(actions))
+    return state
+
+def measure(game, states, depth, smp=None):
+    """Search every state to depth, returns [(seconds, nodes)] per state"""
+    results = []
+    for state in states:
+        Lasker_Morris.eval_cache.clear()
+        timer = TimeManager(math.inf, 0)
+        start = time()
+        if smp is None:
+            alpha_beta_deepening_search(state, game, depth, timer)
+            nodes = timer.nodes
+        else:
+            smp.tt.clear()
+            smp.search(state, game, depth, timer)
+            nodes = smp.nodes
+        results.append((time() - start, nodes))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to depth and nodes/sec of the parallel search")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--depth', type=int, default=6)
+    args = parser.parse_args()
+
+    game = Lasker_Morris()
+    states = [playout(game, seed, plies) for seed, plies in POSITIONS]
+    single = measure(game, states, args.depth)
+    smp = LazySMP(args.threads)
+    try:
+        parallel = measure(game, states, args.depth, smp)
+    finally:
+        smp.close()
+
+    print(f"{'position':>10} {'1 proc s':>9} {'nps':>8} {args.threads:>3} proc s {'nps':>8} {'speedup':>8}")
+    for (seed, plies), (t1, n1), (tn, nn) in zip(POSITIONS, single, parallel):
+        print(f"{seed:>4}/{plies:<5} {t1:9.2f} {n1 / t1:8.0f} {tn:9.2f} {nn / tn:8.0f} {t1 / tn:8.2f}")
+    total1 = sum(t for t, _ in single)
+    totaln = sum(t for t, _ in parallel)
+    print(f"time to depth {args.depth}: {total1:.2f}s -> {totaln:.2f}s, speedup {total1 / totaln:.2f}")
+    print(f"nodes/sec: {sum(n for _, n in single) / total1:.0f} -> {sum(n for _, n in parallel) / totaln:.0f}")
+
+if __name__ == "__main__":
+    main()
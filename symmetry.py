@@ -0,0 +1,67 @@
+# The board is three nested squares joined at the midpoints of their sides. Its 16 symmetries are the
+# 8 rotations/reflections of a square, each with or without swapping the inner and outer ring
+# (the middle ring stays put and the midpoint lines just run the other way).
+# Squares are named like 'd5': column a-g and row 1-7, with d4 the centre
+
+def square_coordinates(name):
+    """(x, y) of a square with the centre at (0, 0), so every coordinate is in -3..3"""
+    return ord(name[0]) - ord('d'), int(name[1]) - 4
+
+def symmetries(positions):
+    """
+    The 16 symmetries of the board as permutations: perm[i] is the index in positions that the square at
+    index i maps to. The identity comes first
+    """
+    index = {square_coordinates(name): i for i, name in enumerate(positions)}
+    transforms = [
+        lambda x, y: (x, y),
+        lambda x, y: (-y, x),
+        lambda x, y: (-x, -y),
+        lambda x, y: (y, -x),
+        lambda x, y: (-x, y),
+        lambda x, y: (x, -y),
+        lambda x, y: (y, x),
+        lambda x, y: (-y, -x),
+    ]
+    perms = []
+    for swap_rings in (False, True):
+        for transform in transforms:
+            perm = []
+            for name in positions:
+                x, y = transform(*square_coordinates(name))
+                if swap_rings:
+                    # Ring 1 (inner) and ring 3 (outer) trade places
+                    ring = max(abs(x), abs(y))
+                    x, y = x * (4 - ring) // ring, y * (4 - ring) // ring
+                perm.append(index[(x, y)])
+            perms.append(tuple(perm))
+    return perms
+
+def inverse(perm):
+    result = [0] * len(perm)
+    for i, j in enumerate(perm):
+        result[j] = i
+    return tuple(result)
+
+def transform_mask(mask, perm):
+    """Apply a permutation to a bitboard"""
+    result = 0
+    while mask:
+        low = mask & -mask
+        result |= 1 << perm[low.bit_length() - 1]
+        mask ^= low
+    return result
+
+def canonical_pieces(blue, orange, perms):
+    """
+    The smallest (blue, orange) pair over all the symmetries, and the index of a symmetry that produces it.
+    Positions that are the same up to symmetry get the same pair
+    """
+    best = None
+    best_index = 0
+    for i, perm in enumerate(perms):
+        pair = (transform_mask(blue, perm), transform_mask(orange, perm))
+        if best is None or pair < best:
+            best = pair
+            best_index = i
+    return best, best_index
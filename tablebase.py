@@ -0,0 +1,95 @@
+import mmap
+import os
+import re
+import struct
+from math import comb
+
+# Endgame tablebases for positions where neither player has stones in hand, built by tablebase_builder.py.
+# There is one file per (stones of the side to move, stones of the other side), named like tb_4v3.bin.
+# After the header it holds one signed byte per position, from the point of view of the side to move:
+#   0   draw, whatever the stalemate counter says
+#   +d  win, as long as at least d moves are left before the stalemate counter reaches its limit (a draw otherwise)
+#   -d  loss, under the same condition
+# Positions are numbered by a perfect ranking (see rank), so every table has exactly one byte per position
+MAGIC = b'LMTB1\n'
+HEADER = struct.Struct('<6sBBQ')
+SQUARES = 24
+FILE_NAME = re.compile(r'tb_(\d+)v(\d+)\.bin$')
+
+def table_name(stm_stones, opp_stones):
+    return f'tb_{stm_stones}v{opp_stones}.bin'
+
+def table_size(stm_stones, opp_stones):
+    return comb(SQUARES, stm_stones) * comb(SQUARES - stm_stones, opp_stones)
+
+def colex_rank(mask):
+    """Position of a set of squares among all sets of the same size, in colexicographic order"""
+    rank = 0
+    k = 0
+    while mask:
+        low = mask & -mask
+        k += 1
+        rank += comb(low.bit_length() - 1, k)
+        mask ^= low
+    return rank
+
+def compress(mask, space):
+    """Renumber the squares of mask (a subset of space) by their order within space"""
+    result = 0
+    k = 0
+    while space:
+        low = space & -space
+        if mask & low:
+            result |= 1 << k
+        k += 1
+        space ^= low
+    return result
+
+def rank(stm, opp):
+    """
+    Index of a position in its table: the rank of the side to move's squares among all sets of that size,
+    then the rank of the other side's squares among the sets that fit in the squares left empty
+    """
+    a = stm.bit_count()
+    b = opp.bit_count()
+    free = ((1 << SQUARES) - 1) & ~stm
+    return colex_rank(stm) * comb(SQUARES - a, b) + colex_rank(compress(opp, free))
+
+class Tablebases():
+    """Every table found in a directory, memory mapped and probed one byte at a time"""
+    def __init__(self, directory):
+        self.tables = {}
+        for name in sorted(os.listdir(directory)):
+            match = FILE_NAME.match(name)
+            if match:
+                a, b = int(match.group(1)), int(match.group(2))
+                self.tables[a, b] = self.open_table(os.path.join(directory, name), a, b)
+
+    @staticmethod
+    def open_table(path, a, b):
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, stm_stones, opp_stones, count = HEADER.unpack_from(data, 0)
+        if (magic != MAGIC or (stm_stones, opp_stones) != (a, b) or count != table_size(a, b)
+                or len(data) != HEADER.size + count):
+            raise ValueError(f"{path} is not a {a}v{b} tablebase")
+        return memoryview(data)[HEADER.size:].cast('b')
+
+    def probe(self, stm, opp):
+        """The stored byte for a position (see the top of this file), None if there's no table for its stone counts"""
+        table = self.tables.get((stm.bit_count(), opp.bit_count()))
+        if table is None:
+            return None
+        return table[rank(stm, opp)]
+
+    def __contains__(self, counts):
+        return counts in self.tables
+
+    def __len__(self):
+        return len(self.tables)
+
+def write_table(path, stm_stones, opp_stones, values):
+    """Write a table: values is a bytes-like object with one signed byte per position, in rank order"""
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, stm_stones, opp_stones, table_size(stm_stones, opp_stones)))
+        f.write(values)
@@ -0,0 +1,242 @@
+"""
+Solves the endgames where neither player has stones in hand by retrograde analysis and writes the tables
+that tablebase.py probes (see there for the file format). Needs numpy.
+
+Every table is solved for each number of moves left before the stalemate counter ends the game: with 0 moves left
+the game is over, with r moves left a position is worth the best of its moves, where a capture resets the counter
+(and leads into a smaller, already solved table) and any other move leaves r - 1. The byte stored is the result with
+all 20 moves left, and the smallest number of moves left from which that result holds.
+
+    python tablebase_builder.py --max-stones 6 --output tablebases
+"""
+import argparse
+import os
+from itertools import combinations
+from math import comb
+from time import time
+
+import numpy as np
+
+from Lake_Morts import MILL_MASKS, MILLS_BY_SQUARE, Lasker_Morris, stalemate_threshold, tablebase_dir
+from tablebase import SQUARES, rank, table_name, table_size, write_table
+
+FULL = (1 << SQUARES) - 1
+ADJACENT_MASKS = Lasker_Morris.ADJACENT_MASKS
+ADJACENT_SQUARES = [[sq for sq in range(SQUARES) if mask >> sq & 1] for mask in ADJACENT_MASKS]
+
+# Byte lookup tables, so masks can be ranked a whole array at a time
+POP8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+# RANK_BYTES[j, c, byte]: what the bits of byte j add to a colex rank (see tablebase.colex_rank)
+# when c bits are set below that byte
+RANK_BYTES = np.zeros((3, SQUARES + 1, 256), dtype=np.int64)
+for _j in range(3):
+    for _c in range(SQUARES + 1):
+        for _byte in range(256):
+            _k = _c
+            for _q in range(8):
+                if _byte >> _q & 1:
+                    _k += 1
+                    RANK_BYTES[_j, _c, _byte] += comb(8 * _j + _q, _k)
+# PEXT[space, mask]: the bits of mask that are in space, packed down to the bottom
+PEXT = np.zeros((256, 256), dtype=np.int64)
+for _space in range(256):
+    _bits = [q for q in range(8) if _space >> q & 1]
+    for _mask in range(256):
+        PEXT[_space, _mask] = sum(1 << k for k, q in enumerate(_bits) if _mask >> q & 1)
+
+def popcounts(masks):
+    return POP8[masks & 255] + POP8[(masks >> 8) & 255] + POP8[masks >> 16]
+
+def colex_ranks(masks):
+    """tablebase.colex_rank of every mask in an array"""
+    b0 = masks & 255
+    b1 = (masks >> 8) & 255
+    c0 = POP8[b0]
+    return RANK_BYTES[0, 0, b0] + RANK_BYTES[1, c0, b1] + RANK_BYTES[2, c0 + POP8[b1], masks >> 16]
+
+def compress_many(masks, spaces):
+    """tablebase.compress of every (mask, space) pair in two arrays"""
+    s0 = spaces & 255
+    s1 = (spaces >> 8) & 255
+    low = POP8[s0]
+    return (PEXT[s0, masks & 255] | (PEXT[s1, (masks >> 8) & 255] << low) |
+            (PEXT[spaces >> 16, masks >> 16] << (low + POP8[s1])))
+
+def ranks(stm, opp, a, b):
+    """tablebase.rank of every position in two arrays, the side to move has a stones and the other b"""
+    return colex_ranks(stm) * comb(SQUARES - a, b) + colex_ranks(compress_many(opp, FULL & ~stm))
+
+def subsets(n, k):
+    """Every set of k squares out of n as masks, in colex order"""
+    masks = np.array([sum(1 << i for i in c) for c in combinations(range(n), k)], dtype=np.int64)
+    return masks[np.argsort(colex_ranks(masks))]
+
+def enumerate_positions(a, b):
+    """(stm, opp) mask arrays of every position with a stones for the side to move and b for the other, in rank order"""
+    stm = subsets(SQUARES, a)
+    compressed = subsets(SQUARES - a, b)
+    free = np.array([[sq for sq in range(SQUARES) if not m >> sq & 1] for m in stm.tolist()], dtype=np.int64)
+    opp = np.zeros((len(stm), len(compressed)), dtype=np.int64)
+    for k in range(SQUARES - a):
+        opp |= ((compressed >> k) & 1)[None, :] << free[:, k][:, None]
+    return np.repeat(stm, len(compressed)), opp.ravel()
+
+def has_moves(own, other, stones):
+    """Whether the side with these stones (and nothing in hand) has a legal move"""
+    if stones < 3:
+        return np.zeros(len(own), dtype=bool)
+    if stones == 3:
+        return np.ones(len(own), dtype=bool)  # Flying, and there are always empty squares in these endgames
+    empty = FULL & ~(own | other)
+    result = np.zeros(len(own), dtype=bool)
+    for sq in range(SQUARES):
+        result |= (((own >> sq) & 1) != 0) & ((empty & ADJACENT_MASKS[sq]) != 0)
+    return result
+
+def removable(stones):
+    """Lasker_Morris.removable of every mask in an array"""
+    milled = np.zeros_like(stones)
+    for mill in MILL_MASKS:
+        milled |= np.where((stones & mill) == mill, mill, 0)
+    free = stones & ~milled
+    return np.where(free != 0, free, stones)
+
+def forms_mill(stones, sq):
+    first, second = MILLS_BY_SQUARE[sq]
+    return ((stones & first) == first) | ((stones & second) == second)
+
+class Table():
+    """One table being solved: every position with a stones for the side to move and b for the other"""
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.stm, self.opp = enumerate_positions(a, b)
+        self.size = len(self.stm)
+        self.opp_rank = colex_ranks(self.opp)
+        # Positions with a stone to move on each square
+        self.by_square = [np.nonzero((self.stm >> sq) & 1)[0] for sq in range(SQUARES)]
+        self.stm_moves = has_moves(self.stm, self.opp, a)
+        self.opp_moves = has_moves(self.opp, self.stm, b)
+        # What Lasker_Morris.evaluate says once the counter runs out, and when the side to move is stuck
+        self.values = np.where(~self.opp_moves, 1, np.where(~self.stm_moves, -1, 0)).astype(np.int8)
+        self.stuck = ~self.stm_moves
+        self.stuck_values = np.where(self.opp_moves, -1, 1).astype(np.int8)
+        self.last_change = np.ones(self.size, dtype=np.int8)
+        self.irregular = 0
+        self.captures = None
+
+    def moves(self, src):
+        """(positions, stm after lifting the stone on src, opp, target squares) for every stone on src"""
+        idx = self.by_square[src]
+        stm = self.stm[idx] ^ (1 << src)
+        targets = [sq for sq in range(SQUARES) if sq != src] if self.a == 3 else ADJACENT_SQUARES[src]
+        return idx, stm, self.opp[idx], targets
+
+    def solve_captures(self, solved):
+        """Best value of the mill closing moves of every position (-2 where there are none), this never changes"""
+        best = np.full(self.size, -2, dtype=np.int8)
+        victims = removable(self.opp)
+        for src in range(SQUARES):
+            idx, stm, opp, targets = self.moves(src)
+            empty = FULL & ~(stm | opp)
+            for tgt in targets:
+                sub = np.nonzero((empty >> tgt) & 1)[0]
+                moved = stm[sub] | (1 << tgt)
+                mill = forms_mill(moved, tgt)
+                sub, moved = sub[mill], moved[mill]
+                for victim in range(SQUARES):
+                    hit = np.nonzero((victims[idx[sub]] >> victim) & 1)[0]
+                    if not len(hit):
+                        continue
+                    left = opp[sub[hit]] ^ (1 << victim)
+                    if self.b - 1 < 3:
+                        # The other side is down to 2 stones and stuck, so it has lost unless we can't move either
+                        values = np.where(has_moves(moved[hit], left, self.a), 1, -1).astype(np.int8)
+                    else:
+                        child = ranks(left, moved[hit], self.b - 1, self.a)
+                        values = -solved[self.b - 1, self.a][child]
+                    positions = idx[sub[hit]]
+                    best[positions] = np.maximum(best[positions], values)
+        self.captures = best
+
+    def step(self, other):
+        """Values with one more move left, from the other side's table with one move fewer left"""
+        best = self.captures.copy()
+        multiplier = comb(SQUARES - self.b, self.a)
+        for src in range(SQUARES):
+            idx, stm, opp, targets = self.moves(src)
+            if not len(idx):
+                continue
+            space = FULL & ~opp
+            base = self.opp_rank[idx] * multiplier
+            compressed = compress_many(stm, space)
+            empty = space & ~stm
+            for tgt in targets:
+                sub = np.nonzero((empty >> tgt) & 1)[0]
+                sub = sub[~forms_mill(stm[sub] | (1 << tgt), tgt)]
+                if not len(sub):
+                    continue
+                # tgt's number among the squares the other side leaves free
+                target = tgt - popcounts(opp[sub] & ((1 << tgt) - 1))
+                child = base[sub] + colex_ranks(compressed[sub] | (1 << target))
+                positions = idx[sub]
+                best[positions] = np.maximum(best[positions], -other[child])
+        best[self.stuck] = self.stuck_values[self.stuck]
+        return best
+
+    def update(self, values, moves_left):
+        """Take the values for moves_left moves left, returns how many positions changed"""
+        changed = values != self.values
+        if moves_left > 1:
+            self.irregular += int(np.count_nonzero(changed & (self.values != 0)))
+        self.last_change[changed] = moves_left
+        self.values = values
+        return int(np.count_nonzero(changed))
+
+    def encoded(self):
+        return (self.values * self.last_change).astype(np.int8)
+
+def solve(a, b, solved, verbose=False):
+    """Solve the tables a v b and b v a together (each one's quiet moves lead into the other)"""
+    start = time()
+    tables = [Table(a, b)] if a == b else [Table(a, b), Table(b, a)]
+    for table in tables:
+        table.solve_captures(solved)
+    for moves_left in range(1, stalemate_threshold + 1):
+        previous = [table.values for table in tables]
+        steps = [table.step(previous[-1 - i]) for i, table in enumerate(tables)]
+        changed = sum(table.update(values, moves_left) for table, values in zip(tables, steps))
+        if verbose:
+            print(f"  {a}v{b} {moves_left} moves left: {changed} changed")
+        if not changed:
+            break
+    for table in tables:
+        solved[table.a, table.b] = table.values
+        if verbose:
+            wins = int(np.count_nonzero(table.values > 0))
+            losses = int(np.count_nonzero(table.values < 0))
+            print(f"{table.a}v{table.b}: {table.size} positions, {wins} won, {losses} lost, "
+                  f"{table.irregular} irregular, {time() - start:.1f}s")
+    return tables
+
+def main():
+    parser = argparse.ArgumentParser(description="Build endgame tablebases for positions with no stones in hand")
+    parser.add_argument('--max-stones', type=int, default=6, help="largest number of stones on the board to solve")
+    parser.add_argument('--output', default=tablebase_dir)
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    solved = {}
+    for total in range(6, args.max_stones + 1):
+        for a in range(3, total // 2 + 1):
+            b = total - a
+            for table in solve(a, b, solved, verbose=True):
+                # Spot check the array ranking against the one the engine probes with
+                for i in np.linspace(0, table.size - 1, 50).astype(np.int64):
+                    assert rank(int(table.stm[i]), int(table.opp[i])) == i
+                write_table(os.path.join(args.output, table_name(table.a, table.b)), table.a, table.b,
+                            table.encoded().tobytes())
+                assert table_size(table.a, table.b) == table.size
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+from time import time
+
+# Share of the per-move budget after which no new iteration is started, by game phase of the player to move.
+# Past that point the search only finishes the iteration it is in (unless the hard limit cuts it off)
+PHASE_TIME_SHARE = {
+    'placement': 0.6,
+    'moving': 0.7,
+    'flying': 0.7,
+}
+
+class SearchTimeout(Exception):
+    """Raised from inside the search when the hard time limit is hit, the unfinished iteration is thrown away"""
+
+class TimeManager():
+    """
+    Keeps track of the time budget for one move.
+    The search calls tick() at every node and the clock is only read every check_every nodes.
+    The iterative deepening driver asks can_start_iteration() before every new depth.
+    While pondering there are no deadlines, the search runs until stop() or ponderhit() is called from another thread.
+    stop_event (a multiprocessing Event) lets another process stop the search too.
+    node_limit stops the search after that many nodes (checked every check_every nodes), whatever the clock says
+    """
+    def __init__(self, time_limit=5, safe_margin=0.25, check_every=256, stop_event=None, node_limit=float('inf')):
+        self.time_limit = time_limit
+        self.safe_margin = safe_margin
+        self.check_every = check_every
+        self.stop_event = stop_event
+        self.node_limit = node_limit
+        self.pondering = False
+        self.stopped = False
+        self.start()
+
+    def start(self, phase=None):
+        """Start the clock for a new move, phase picks how much of the budget new iterations may start in"""
+        self.start_time = time()
+        self.phase = phase
+        if self.pondering:
+            self.hard_deadline = self.soft_deadline = float('inf')
+        else:
+            self.set_deadlines(self.start_time)
+        self.nodes = 0
+        self.next_check = self.check_every
+        self.iteration_start = self.start_time
+        self.iteration_start_nodes = 0
+        self.iteration_times = []
+        self.iteration_nodes = []  # Nodes of every finished iteration
+
+    def set_deadlines(self, now):
+        budget = max(self.time_limit - self.safe_margin, 0)
+        self.hard_deadline = now + budget
+        self.soft_deadline = now + budget * PHASE_TIME_SHARE.get(self.phase, 1.0)
+
+    def ponder(self):
+        """Make the next search run without a time limit, until it is stopped or gets a ponder hit"""
+        self.pondering = True
+        self.stopped = False
+
+    def ponderhit(self):
+        """The opponent played the move we pondered on: from now on the normal budget for a move applies"""
+        self.pondering = False
+        self.set_deadlines(time())
+
+    def stop(self):
+        """Abort the search at its next clock check"""
+        self.stopped = True
+
+    def elapsed(self):
+        return time() - self.start_time
+
+    def tick(self):
+        """Count a node, and abort the search if the hard deadline or the node limit has passed"""
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.next_check += self.check_every
+            if self.stop_event is not None and self.stop_event.is_set():
+                self.stopped = True
+            if self.stopped or time() > self.hard_deadline or self.nodes >= self.node_limit:
+                raise SearchTimeout()
+
+    def start_iteration(self):
+        self.iteration_start = time()
+        self.iteration_start_nodes = self.nodes
+
+    def end_iteration(self):
+        self.iteration_times.append(time() - self.iteration_start)
+        self.iteration_nodes.append(self.nodes - self.iteration_start_nodes)
+
+    def can_start_iteration(self):
+        """
+        True if there's time for another iteration: we are before the soft deadline and the next iteration,
+        estimated from how fast the last ones grew, should finish before the hard deadline
+        """
+        now = time()
+        if self.stopped or now >= self.soft_deadline:
+            return False
+        times = self.iteration_times
+        if len(times) >= 2 and times[-2] > 0.001:
+            growth = min(max(times[-1] / times[-2], 2.0), 10.0)
+        else:
+            growth = 4.0
+        estimate = times[-1] * growth if times else 0
+        return now + estimate < self.hard_deadline
@@ -0,0 +1,242 @@
+import mmap
+import os
+import struct
+import threading
+from array import array
+from operator import xor
+
+# Bound types stored with every entry (0 means the slot is empty)
+EXACT = 1
+LOWER = 2  # search failed high, the real value is >= the stored one
+UPPER = 3  # search failed low, the real value is <= the stored one
+
+# Every entry is a key, a packed info word and a value, 8 bytes each
+ENTRY_BYTES = 24
+# The info word packs the best move (bits 0-15), depth (bits 16-23), bound type (bits 24-25) and the generation
+# of the search that last stored or used the entry (bits 26-31), which wraps around
+GENERATION_SHIFT = 26
+GENERATIONS = 64
+# Snapshot files: this header (magic, entries, generation, whether the keys are XORed with the info word and the
+# value's bits, and a tag the caller picks) followed by the keys, info words and values
+SNAPSHOT_MAGIC = b'LMTTSNP2'
+SNAPSHOT_HEADER = struct.Struct('<8sQQQQ')
+# A value's float64 bits as an int64 and back
+VALUE_BITS = struct.Struct('<q')
+VALUE = struct.Struct('<d')
+
+def table_entries(size_mb, entry_bytes):
+    """Largest power of two number of entries that fits in size_mb, so the index is just key & mask"""
+    entries = 1
+    while entries * 2 * entry_bytes <= size_mb * 1024 * 1024:
+        entries *= 2
+    return entries
+
+class TranspositionTable():
+    """
+    Fixed-size transposition table indexed by Zobrist key.
+    The table never grows past its memory budget: each key maps to exactly one slot. A table can be kept from one
+    search to the next, new_search() starts a new generation. A slot holding a different position is overwritten
+    by a new entry if that position wasn't stored or used in the current generation, and otherwise only by an entry
+    searched at least as deep
+    """
+    XORED_KEYS = False  # Whether keys are stored XORed with the info word, as in snapshot files
+
+    def __init__(self, size_mb=32):
+        entries = table_entries(size_mb, ENTRY_BYTES)
+        self.size = entries
+        self.mask = entries - 1
+        self.keys = array('q', [0]) * entries
+        self.info = array('q', [0]) * entries
+        self.values = array('d', [0.0]) * entries
+        self.generation = 0
+
+    def new_search(self):
+        """Start a new generation, everything stored so far becomes the first to go when slots are needed"""
+        self.generation = (self.generation + 1) % GENERATIONS
+
+    def probe(self, key):
+        """Return (depth, bound, value, move) stored for key, or None if the position isn't in the table"""
+        i = key & self.mask
+        if self.keys[i] != key:
+            return None
+        info = self.info[i]
+        bound = (info >> 24) & 3
+        if not bound:
+            return None
+        if info >> GENERATION_SHIFT != self.generation:
+            # Still useful, so it belongs to the current search now
+            self.info[i] = (info & ((1 << GENERATION_SHIFT) - 1)) | (self.generation << GENERATION_SHIFT)
+        return (info >> 16) & 0xFF, bound, self.values[i], info & 0xFFFF
+
+    def store(self, key, depth, bound, value, move=0):
+        """Save a search result, keeping a deeper entry of another position from the current generation"""
+        i = key & self.mask
+        info = self.info[i]
+        generation = self.generation
+        if (self.keys[i] != key and (info >> 24) & 3 and info >> GENERATION_SHIFT == generation
+                and (info >> 16) & 0xFF > depth):
+            return
+        self.keys[i] = key
+        self.info[i] = (generation << GENERATION_SHIFT) | (bound << 24) | (min(max(depth, 0), 255) << 16) | (move or 0)
+        self.values[i] = value
+
+    def clear(self):
+        """Forget every stored entry"""
+        self.info = array('q', [0]) * self.size
+
+    def __len__(self):
+        """Number of occupied slots"""
+        return sum(1 for info in self.info if info)
+
+    def save(self, path, tag=0, background=False):
+        """
+        Write the table to a snapshot file. tag stands for whatever the stored values depend on (the evaluation
+        weights, whose point of view the values are from), load() only takes a snapshot with the same tag.
+        With background the entries are copied and written out by a thread, which is returned, so the table can
+        be searched into again right away
+        """
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.size, self.generation, self.XORED_KEYS, tag)
+        if not background:
+            write_snapshot(path, header, (self.keys, self.info, self.values))
+            return None
+        # Copying is a few hundredths of a second for the default table, writing it out ten times that
+        entries = (bytes(self.keys), bytes(self.info), bytes(self.values))
+        thread = threading.Thread(target=write_snapshot, args=(path, header, entries), daemon=True)
+        thread.start()
+        return thread
+
+    def load(self, path, tag=0):
+        """
+        Fill the table from a snapshot file written by save(), returns False and leaves the table as it is
+        if the file is of a table of another size, has another tag or is cut short
+        """
+        with open(path, 'rb') as f:
+            header = f.read(SNAPSHOT_HEADER.size)
+            if len(header) != SNAPSHOT_HEADER.size:
+                return False
+            magic, size, generation, xored, file_tag = SNAPSHOT_HEADER.unpack(header)
+            if magic != SNAPSHOT_MAGIC or size != self.size or file_tag != tag:
+                return False
+            keys, info, values = array('q'), array('q'), array('d')
+            try:
+                keys.fromfile(f, size)
+                info.fromfile(f, size)
+                values.fromfile(f, size)
+            except EOFError:
+                return False
+        if bool(xored) != self.XORED_KEYS:
+            # Written by the other kind of table, XORing with the info word and the value's bits goes either way
+            keys = array('q', map(xor, keys, map(xor, info, array('q', values.tobytes()))))
+        self.set_entries(keys, info, values)
+        self.generation = generation
+        return True
+
+    def set_entries(self, keys, info, values):
+        self.keys, self.info, self.values = keys, info, values
+
+def write_snapshot(path, header, entries):
+    # Written next to it and renamed, so a process killed while saving leaves the last snapshot as it was
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(header)
+        for words in entries:
+            f.write(words)
+    os.replace(temporary, path)
+
+class SharedTranspositionTable(TranspositionTable):
+    """
+    Transposition table in an anonymous shared memory map, so processes forked after it is created
+    all search into the same table (Lazy SMP).
+    Writes aren't locked. The key word is stored XORed with the info word and the bits of the value, so an entry
+    torn by two processes writing the same slot at once, or read while it is being written, no longer matches its
+    key and just reads as empty.
+    The generation is kept in the map too, so every process stores and replaces by the same one
+    """
+    XORED_KEYS = True
+
+    def __init__(self, size_mb=32):
+        entries = table_entries(size_mb, ENTRY_BYTES)
+        self.size = entries
+        self.mask = entries - 1
+        # A fresh anonymous map is zero filled, which is an empty table in generation 0
+        self.buffer = mmap.mmap(-1, entries * ENTRY_BYTES + 8)
+        view = memoryview(self.buffer)
+        self.keys = view[:entries * 8].cast('q')
+        self.info = view[entries * 8:entries * 16].cast('q')
+        self.values = view[entries * 16:entries * 24].cast('d')
+        self.value_bits = view[entries * 16:entries * 24].cast('q')  # The same words as values
+        self.shared_generation = view[entries * 24:].cast('q')
+
+    @property
+    def generation(self):
+        return self.shared_generation[0]
+
+    @generation.setter
+    def generation(self, generation):
+        self.shared_generation[0] = generation
+
+    def probe(self, key):
+        i = key & self.mask
+        info = self.info[i]
+        # The value is read once, as bits, so the value returned is the one that was checked against the key
+        bits = self.value_bits[i]
+        bound = (info >> 24) & 3
+        if self.keys[i] ^ info ^ bits != key or not bound:
+            return None
+        generation = self.shared_generation[0]
+        if info >> GENERATION_SHIFT != generation:
+            refreshed = (info & ((1 << GENERATION_SHIFT) - 1)) | (generation << GENERATION_SHIFT)
+            self.info[i] = refreshed
+            self.keys[i] = key ^ refreshed ^ bits
+        return (info >> 16) & 0xFF, bound, VALUE.unpack(VALUE_BITS.pack(bits))[0], info & 0xFFFF
+
+    def store(self, key, depth, bound, value, move=0):
+        i = key & self.mask
+        info = self.info[i]
+        generation = self.shared_generation[0]
+        if (self.keys[i] ^ info ^ self.value_bits[i] != key and (info >> 24) & 3
+                and info >> GENERATION_SHIFT == generation and (info >> 16) & 0xFF > depth):
+            return
+        info = (generation << GENERATION_SHIFT) | (bound << 24) | (min(max(depth, 0), 255) << 16) | (move or 0)
+        self.info[i] = info
+        self.values[i] = value
+        # The key goes last, a probe in between sees a key that doesn't match yet
+        self.keys[i] = key ^ info ^ self.value_bits[i]
+
+    def clear(self):
+        self.buffer[self.size * 8:self.size * 16] = bytes(self.size * 8)
+
+    def set_entries(self, keys, info, values):
+        # Copied into the map, processes already forked see them
+        self.keys[:] = keys
+        self.info[:] = info
+        self.values[:] = values
+
+class EvalCache():
+    """
+    Fixed-size cache of static evaluations by Zobrist key.
+    Each key maps to one slot and a new entry simply replaces whatever was there
+    """
+    def __init__(self, size_mb=8):
+        # A key and a value per entry, 8 bytes each
+        entries = table_entries(size_mb, 16)
+        self.size = entries
+        self.mask = entries - 1
+        self.keys = array('q', [0]) * entries
+        self.values = array('q', [0]) * entries
+
+    def get(self, key):
+        """Return the value cached for key, or None"""
+        i = key & self.mask
+        if self.keys[i] != key:
+            return None
+        return self.values[i]
+
+    def put(self, key, value):
+        i = key & self.mask
+        self.keys[i] = key
+        self.values[i] = value
+
+    def clear(self):
+        """Forget every cached value"""
+        self.keys = array('q', [0]) * self.size
@@ -0,0 +1,176 @@
+"""
+Texel tuning of the utility() weights: fits the phase weights (mills, potential mills, pieces, legal moves) and the
+placement square weights to the results of recorded games, by minimising the squared error between the game result
+and sigmoid(K * utility) over every position of the games. Needs numpy.
+
+The games are the JSON lines arena.py --output writes. Every position of every game is replayed with
+Lasker_Morris.result and turned into a feature vector once, so that utility() is a matrix product with the weights,
+and each optimisation step scores all positions in one pass. The result is written in the format of
+Lake_Morts.get_weights, for Lake_Morts.py --weights, arena.py weights=... or Lake_Morts.load_weights.
+
+    python arena.py --a depth=3 --b depth=3 --openings 500 --output games.jsonl
+    python tuning.py games.jsonl --output tuned_weights.json
+"""
+import argparse
+import json
+from time import time
+
+import numpy as np
+
+from Lake_Morts import (EVAL_SCALE, PHASE_WEIGHTS, PLAYER_INDEX, POSITIONAL_WEIGHT, POSITIONS, Lasker_Morris,
+                        get_weights, parse_move, stalemate_threshold)
+from perft import parse_position
+
+PHASES = tuple(PHASE_WEIGHTS)
+TERMS = 4  # mills, potential mills, pieces, legal moves
+SQUARE_FEATURES = len(PHASES) * TERMS  # Index of the first square feature
+
+def features(game, state):
+    """
+    Feature vector of a position for the player to move, so that utility() is its dot product with weight_vector().
+    Terminal positions aren't scored by the weights and have no features (None)
+    """
+    p = PLAYER_INDEX[state.to_move]
+    o = 1 - p
+    moves_player = game.count_moves(state, p)
+    moves_opponent = game.count_moves(state, o)
+    if state.stalemate_count >= stalemate_threshold or moves_player == 0:
+        return None
+    x = np.zeros(SQUARE_FEATURES + len(POSITIONS))
+    phase = game.phase(state, p)
+    terms = state.mill_terms
+    mills = (terms & 0xFF) - ((terms >> 8) & 0xFF)
+    potential_mills = ((terms >> 16) & 0xFF) - (terms >> 24)
+    if p == 1:
+        mills, potential_mills = -mills, -potential_mills
+    base = PHASES.index(phase) * TERMS
+    x[base:base + TERMS] = (mills, potential_mills, state.on_board[p] - state.on_board[o],
+                            moves_player - moves_opponent)
+    if phase == 'placement':
+        for sq in range(len(POSITIONS)):
+            x[SQUARE_FEATURES + sq] = (state.pieces[p] >> sq & 1) - (state.pieces[o] >> sq & 1)
+    return x
+
+def weight_vector(weights):
+    """The weights (as get_weights returns them) as one vector, the square weights times the positional weight"""
+    w = np.zeros(SQUARE_FEATURES + len(POSITIONS))
+    for i, phase in enumerate(PHASES):
+        w[i * TERMS:(i + 1) * TERMS] = weights['phase'][phase]
+    w[SQUARE_FEATURES:] = [weights['positional'] * weights['position'][pos] for pos in POSITIONS]
+    return w
+
+def engine_vector(w):
+    """
+    The weights as the engine plays them: it scores in 1/EVAL_SCALE of a point, so every phase weight and every
+    square weight times the positional weight is rounded to that (see Lake_Morts.set_weights)
+    """
+    return np.round(w * EVAL_SCALE) / EVAL_SCALE
+
+def weights_from_vector(w, positional=POSITIONAL_WEIGHT):
+    """
+    Inverse of weight_vector for a vector already rounded by engine_vector, keeping the positional weight as it is.
+    The square weights get enough decimals that set_weights rounds them back to the same values
+    """
+    return {'phase': {phase: [round(float(v), 3) for v in w[i * TERMS:(i + 1) * TERMS]]
+                      for i, phase in enumerate(PHASES)},
+            'positional': positional,
+            'position': {pos: round(float(w[SQUARE_FEATURES + i] / positional), 6) for i, pos in enumerate(POSITIONS)}}
+
+def load_positions(game, paths, skip_plies=0):
+    """
+    Feature matrix X and result vector y (1 won, 0.5 drawn, 0 lost, for the player to move) of every non-terminal
+    position in the game records, leaving out the first skip_plies positions of each game
+    """
+    rows = []
+    results = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                a_score = record['score']
+                blue_score = a_score if record['a_color'] == 'blue' else 1 - a_score
+                state = parse_position(record['opening'])
+                for ply, text in enumerate([None] + record['moves']):
+                    if text is not None:
+                        state = game.result(state, parse_move(text))
+                    if ply < skip_plies:
+                        continue
+                    x = features(game, state)
+                    if x is not None:
+                        rows.append(x)
+                        results.append(blue_score if state.to_move == 'blue' else 1 - blue_score)
+    return np.array(rows), np.array(results)
+
+def sigmoid(v):
+    return 1 / (1 + np.exp(-v))
+
+def error(X, y, w, k):
+    return float(np.mean((y - sigmoid(k * (X @ w))) ** 2))
+
+def fit_k(X, y, w):
+    """The scale K that makes the current weights predict the results best, by golden section search"""
+    low, high = 1e-4, 1.0
+    ratio = (5 ** 0.5 - 1) / 2
+    for _ in range(60):
+        a = high - ratio * (high - low)
+        b = low + ratio * (high - low)
+        if error(X, y, w, a) < error(X, y, w, b):
+            high = b
+        else:
+            low = a
+    return (low + high) / 2
+
+def tune(X, y, w, k, steps=2000, rate=0.05, verbose=False):
+    """
+    Minimise the mean squared error over the weights with Adam, K stays fixed. Every step is one vectorized pass
+    over all positions. Features that never occur keep their weight
+    """
+    w = w.copy()
+    # Adam works on the weights relative to their scale, so mills and square weights move at comparable speeds
+    scale = np.maximum(np.abs(w), 1.0)
+    m = np.zeros_like(w)
+    v = np.zeros_like(w)
+    beta1, beta2 = 0.9, 0.999
+    for step in range(1, steps + 1):
+        p = sigmoid(k * (X @ w))
+        gradient = (-2 * k / len(y)) * (X.T @ ((y - p) * p * (1 - p)))
+        m = beta1 * m + (1 - beta1) * gradient
+        v = beta2 * v + (1 - beta2) * gradient ** 2
+        w -= rate * scale * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + 1e-12)
+        if verbose and step % 200 == 0:
+            print(f"  step {step}: error {error(X, y, w, k):.6f}")
+    return w
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the utility() weights on recorded games")
+    parser.add_argument('games', nargs='+', help="game records, JSON lines as written by arena.py --output")
+    parser.add_argument('--output', default='tuned_weights.json', help="where to write the tuned weights")
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=0.05, help="Adam step size, relative to each weight")
+    parser.add_argument('--skip-plies', type=int, default=0, help="leave out the first positions of every game")
+    args = parser.parse_args()
+
+    game = Lasker_Morris()
+    start = time()
+    X, y = load_positions(game, args.games, args.skip_plies)
+    print(f"{len(y)} positions, mean result {y.mean():.3f}, features built in {time() - start:.1f}s")
+
+    # Errors are of the weights the engine would play, rounded to its precision
+    w = engine_vector(weight_vector(get_weights()))
+    k = fit_k(X, y, w)
+    before = error(X, y, w, k)
+    print(f"K = {k:.5f}, error with the current weights {before:.6f}")
+    start = time()
+    w = tune(X, y, w, k, args.steps, args.rate, verbose=True)
+    fitted = error(X, y, w, k)
+    w = engine_vector(w)
+    after = error(X, y, w, k)
+    print(f"error {before:.6f} -> {after:.6f} in {time() - start:.1f}s ({args.steps} steps, "
+          f"{fitted:.6f} before rounding to the engine's precision)")
+
+    with open(args.output, 'w') as f:
+        json.dump(weights_from_vector(w), f, indent=2)
+    print(f"wrote {args.output}")
+
+if __name__ == "__main__":
+    main()